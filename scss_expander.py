@@ -3,12 +3,582 @@ import re, sys, os
 
 if sys.version < '3':
   from src.src_two.scss_expand import SCSSExpand
+  from src.src_two.buffer_provider import ChunkedBuffer, CountedBuffer, StringBuffer
+  from src.src_two.scss_analyzer import ScssAnalyzer
+  from src.src_two.scss_lexer import BuildCancelled
+  from src.src_two.expansion_cache import ExpansionCache
+  from src.src_two.expand_stats import ExpandStats
+  from src.src_two.import_graph import ImportGraph
+  from src.src_two.extend_index import ExtendIndex
+  from src.src_two.selector_index import SelectorIndex
+  from src.src_two.index_store import IndexStore
+  from src.src_two.reparse import reparse
 else:
   from .src.src_three.scss_expand import SCSSExpand
+  from .src.src_three.buffer_provider import ChunkedBuffer, CountedBuffer, StringBuffer
+  from .src.src_three.scss_analyzer import ScssAnalyzer
+  from .src.src_three.scss_lexer import BuildCancelled
+  from .src.src_three.expansion_cache import ExpansionCache
+  from .src.src_three.expand_stats import ExpandStats
+  from .src.src_three.import_graph import ImportGraph
+  from .src.src_three.extend_index import ExtendIndex
+  from .src.src_three.selector_index import SelectorIndex
+  from .src.src_three.index_store import IndexStore
+  from .src.src_three.reparse import reparse
+
+# Sublime Text 3 has an async thread to build indexes on; ST2 does not
+ASYNC = hasattr(sublime, 'set_timeout_async')
+
+def settings():
+  return sublime.load_settings('SCSSExpander.sublime-settings')
+
+# Timings and counters for a command, when the show_stats setting is on
+def expand_stats():
+  if settings().get('show_stats', False):
+    return ExpandStats()
+  return None
+
+def report_stats(stats):
+  if stats is not None:
+    print(stats)
+    sublime.status_message(stats.summary())
+
+def is_scss(view):
+  return view.score_selector(0, 'source.scss') > 0
+
+# Reads the view a window at a time instead of making one
+# view.substr call per character the expander inspects
+class ViewBuffer(ChunkedBuffer):
+  def __init__(self, view, chunk_size = 4096):
+    ChunkedBuffer.__init__(self, chunk_size)
+    self.view = view
+    self.view_size = view.size()
+
+  def size(self):
+    return self.view_size
+
+  def read(self, start, end):
+    return self.view.substr(sublime.Region(start, end))
+
+# Keeps the analysis of each view, redone only when the view's
+# change count moves on so that queries never rescan the buffer.
+# On ST3 the analysis is built on the async thread from a snapshot of the
+# text, once typing has paused for delay milliseconds; a build that the
+# view has moved past is abandoned. Queries use the finished analysis when
+# it is current and build one on the spot when it is not. With
+# persistent_index on, the analyses of files as they are loaded and saved
+# are kept in Sublime's cache folder, so reopening an unchanged file reads
+# its analysis back.
+class AnalyzerCache():
+  delay = 150
+
+  def __init__(self):
+    self.entries = {} # view id -> (change count, analyzer)
+    self.expansions = {} # view id -> expansion cache, outliving analyzers
+    self.listings = {} # view id -> (change count, [(offset, line, selector)])
+    self.idle = {} # view id -> change count an idle build is waiting for (ST2)
+    self.disk_store = None
+
+  def index_store(self):
+    if not settings().get('persistent_index', True) or not hasattr(sublime, 'cache_path'):
+      return None
+    if self.disk_store is None:
+      self.disk_store = IndexStore(os.path.join(sublime.cache_path(), 'SCSSExpander'),
+                                   settings().get('persistent_index_size', 64) * 1024 * 1024)
+    return self.disk_store
+
+  # With stats, a build done on the spot is timed as the analyze phase
+  def get(self, view, stats = None):
+    change_count = view.change_count()
+    entry = self.entries.get(view.id())
+    if entry is None or entry[0] != change_count:
+      entry = (change_count, self.build(view, stats))
+      self.store(view, entry)
+    return entry[1]
+
+  def build(self, view, stats = None):
+    buffer = ViewBuffer(view)
+    if stats is None:
+      return ScssAnalyzer(buffer.char_at, buffer.size(), view.change_count())
+    buffer = CountedBuffer(buffer, stats)
+    with stats.phase('analyze'):
+      return ScssAnalyzer(buffer.char_at, buffer.size(), view.change_count())
+
+  # The analysis if it is up to date with the view, without building one
+  def current(self, view):
+    entry = self.entries.get(view.id())
+    if entry is None or entry[0] != view.change_count():
+      return None
+    return entry[1]
+
+  # Both threads store analyses; never let an older one replace a newer
+  def store(self, view, entry):
+    current = self.entries.get(view.id())
+    if current is None or current[0] < entry[0]:
+      self.entries[view.id()] = entry
+
+  # ST2 has no async thread, so the analysis is built on the UI thread
+  # once typing has paused for delay milliseconds rather than on every
+  # keystroke; a query before then builds it on the spot
+  def schedule_idle(self, view):
+    change_count = self.idle[view.id()] = view.change_count()
+    sublime.set_timeout(lambda: self.build_idle(view, change_count), self.delay)
+
+  def build_idle(self, view, change_count):
+    # the view has been edited again, or closed, since
+    if self.idle.get(view.id()) != change_count or view.change_count() != change_count:
+      return
+    del self.idle[view.id()]
+    self.get(view)
+
+  def schedule(self, view, delay = None, save = False):
+    change_count = view.change_count()
+    sublime.set_timeout_async(lambda: self.build_snapshot(view, change_count, save),
+                              self.delay if delay is None else delay)
+
+  # With save, the analysis also goes to the index store. Only loads and
+  # saves ask for that; the states in between typing pauses would just
+  # push unchanged files out of the store.
+  def build_snapshot(self, view, change_count, save = False):
+    def is_cancelled():
+      return not view.is_valid() or view.change_count() != change_count
+
+    # the user kept typing; the build scheduled for that change takes over
+    if is_cancelled():
+      return
+    entry = self.entries.get(view.id())
+    current = entry is not None and entry[0] == change_count
+    store = self.index_store()
+    if current and (not save or store is None):
+      return
+    text = view.substr(sublime.Region(0, view.size()))
+    if is_cancelled():
+      return
+    key = store.key(text) if store is not None else None
+    if current:
+      analyzer = entry[1]
+    else:
+      analyzer = store.load(key, change_count) if store is not None else None
+      # an analysis read back is already stored
+      save = save and analyzer is None
+      if analyzer is None:
+        try:
+          analyzer = ScssAnalyzer(StringBuffer(text).char_at, len(text), change_count, is_cancelled)
+        except BuildCancelled:
+          return
+    if save and store is not None:
+      store.save(key, analyzer)
+    if view.is_valid() and not current:
+      self.store(view, (change_count, analyzer))
+      refresh_live_selector(view)
+
+  # Brings the analysis along with a single edit by relexing just the
+  # block it is in; the scheduled rebuild then finds nothing to do.
+  # change_count is the view's count right after the edit, taken when it
+  # happened. The analysis must be from just before the edit, and the
+  # view still at it so that what is read back is the edited text.
+  # Anything else is left to the rebuild.
+  def apply(self, view, changes, change_count):
+    entry = self.entries.get(view.id())
+    if len(changes) != 1 or entry is None or entry[0] != change_count - 1:
+      return
+    if not view.is_valid() or view.change_count() != change_count:
+      return
+    change = changes[0]
+    start = change.a.pt
+    buffer = ViewBuffer(view)
+    analyzer = reparse(entry[1], start, change.b.pt, start + len(change.str),
+                       buffer.char_at, buffer.size(), change_count)
+    # the view may have moved on while the block was read
+    if analyzer is not None and view.change_count() == change_count:
+      self.store(view, (change_count, analyzer))
+
+  # Expansions are keyed on the change count, so one cache serves
+  # every version of the view and stale entries just age out
+  def expansion_cache(self, view):
+    cache = self.expansions.get(view.id())
+    if cache is None:
+      cache = self.expansions[view.id()] = ExpansionCache()
+    return cache
+
+  # Every expanded selector in the view with the offset and line of its
+  # rule, worked out once per change of the view
+  def symbols(self, view):
+    change_count = view.change_count()
+    listing = self.listings.get(view.id())
+    if listing is None or listing[0] != change_count:
+      expander = SCSSExpand(0, ViewBuffer(view).char_at, ' ', self.get(view),
+                            settings().get('max_selectors', 50), self.expansion_cache(view),
+                            context = import_context(view))
+      symbols = []
+      for start, end, selectors in expander.expand_all():
+        line = view.rowcol(start)[0] + 1
+        symbols.extend((start, line, selector) for selector in selectors)
+      listing = self.listings[view.id()] = (change_count, symbols)
+    return listing[1]
+
+  def discard(self, view):
+    self.entries.pop(view.id(), None)
+    self.idle.pop(view.id(), None)
+    self.expansions.pop(view.id(), None)
+    self.listings.pop(view.id(), None)
+
+analyzers = AnalyzerCache()
+
+# One project index of a kind per set of project folders, scanned when
+# first needed and brought up to date whenever a file is saved. Scanning
+# a large project takes a while, so on ST3 the first scan runs on the
+# async thread: until it is done get() gives None, is_scanning() says
+# why, and callbacks waiting for the index run on the main thread once
+# it is there. ST2 has no async thread and scans on the spot.
+class ProjectIndexes():
+  def __init__(self, index_class):
+    self.index_class = index_class
+    self.indexes = {} # folders -> index, once scanned
+    self.waiting = {} # folders -> callbacks waiting for the first scan
+
+  def folders(self, window):
+    return tuple(window.folders()) if window is not None else ()
+
+  def get(self, window, on_ready = None):
+    folders = self.folders(window)
+    if not folders:
+      return None
+    index = self.indexes.get(folders)
+    if index is not None:
+      return index
+    if not ASYNC:
+      index = self.indexes[folders] = self.index_class(folders)
+      index.refresh()
+      return index
+    callbacks = self.waiting.get(folders)
+    if callbacks is None:
+      callbacks = self.waiting[folders] = []
+      sublime.set_timeout_async(lambda: self.scan(folders), 0)
+    if on_ready is not None:
+      callbacks.append(on_ready)
+    return None
+
+  def scan(self, folders):
+    index = self.index_class(folders)
+    index.refresh()
+    self.indexes[folders] = index
+    for callback in self.waiting.pop(folders, ()):
+      sublime.set_timeout(callback, 0)
+
+  def is_scanning(self, window):
+    return self.folders(window) in self.waiting
+
+  def refresh(self, window):
+    index = self.indexes.get(self.folders(window))
+    if index is not None:
+      index.refresh()
+
+import_graphs = ProjectIndexes(ImportGraph)
+extend_indexes = ProjectIndexes(ExtendIndex)
+selector_indexes = ProjectIndexes(SelectorIndex)
+
+# Says in the status bar why a project index cannot be used yet
+def index_unavailable(indexes, window, reason):
+  if indexes.is_scanning(window):
+    reason = 'still indexing the project, one moment'
+  sublime.status_message('SCSS Expander: ' + reason)
+
+# Runs on the async thread where there is one
+def in_background(callback):
+  if ASYNC:
+    sublime.set_timeout_async(callback, 0)
+  else:
+    callback()
+
+# Starts the scans that the settings turned on will want, so that they are
+# done by the time anything asks
+def prepare_indexes(view):
+  window = view.window()
+  if settings().get('import_contexts', False):
+    import_graphs.get(window)
+  if settings().get('show_extends', False):
+    extend_indexes.get(window)
+  if settings().get('report_duplicates', False):
+    selector_indexes.get(window)
+
+# With import_contexts on, the selectors a partial is imported inside
+# elsewhere in the project go in front of its rules
+def import_context(view):
+  if not settings().get('import_contexts', False) or view.file_name() is None:
+    return None
+  graph = import_graphs.get(view.window())
+  if graph is None:
+    return None
+  return graph.context(view.file_name())
+
+# With show_extends on, rules are followed by the selectors they also
+# compile to because something in the project @extends them
+def extend_index(view):
+  if not settings().get('show_extends', False):
+    return None
+  return extend_indexes.get(view.window())
+
+# With live_selector on, the status bar shows the expanded selector at
+# the first caret. It is only read off the finished analysis and cached
+# expansions; while the analysis is catching up with an edit the last
+# selector stays up, and the build refreshes it when it is done.
+STATUS_KEY = 'scss_expander'
+live_updates = {} # view id -> number of the latest requested update
+
+def refresh_live_selector(view):
+  if not settings().get('live_selector', False):
+    return
+  analyzer = analyzers.current(view)
+  selection = view.sel()
+  if analyzer is None or len(selection) == 0:
+    return
+  expander = SCSSExpand(selection[0].begin(), ViewBuffer(view).char_at, ' ', analyzer,
+                        settings().get('max_selectors', 50), analyzers.expansion_cache(view),
+                        context = import_context(view), extends = extend_index(view))
+  rule = expander.coalesce_rule()
+  if rule:
+    view.set_status(STATUS_KEY, rule)
+  else:
+    view.erase_status(STATUS_KEY)
+
+# Waits for the caret to settle before refreshing; only the update asked
+# for last goes ahead
+def schedule_live_selector(view, delay = 50):
+  number = live_updates.get(view.id(), 0) + 1
+  live_updates[view.id()] = number
+  def update():
+    if live_updates.get(view.id()) == number and view.is_valid():
+      refresh_live_selector(view)
+  sublime.set_timeout_async(update, delay)
+
+# With report_duplicates on, a saved file's status bar counts the compiled
+# selectors it shares with other rules in the project. Only the saved
+# file is scanned again, so this keeps up with every save.
+DUPLICATES_KEY = 'scss_expander_duplicates'
+
+def report_duplicates(view):
+  if not settings().get('report_duplicates', False) or view.file_name() is None:
+    return
+  index = selector_indexes.get(view.window(), lambda: report_duplicates(view))
+  if index is None:
+    return
+  count = len(index.duplicates(view.file_name()))
+  if count:
+    view.set_status(DUPLICATES_KEY, '%d duplicate selector%s' % (count, '' if count == 1 else 's'))
+  else:
+    view.erase_status(DUPLICATES_KEY)
+
+class ScssexpanderListener(sublime_plugin.EventListener):
+  def on_load(self, view):
+    if is_scss(view):
+      follow_edits(view)
+      if not ASYNC:
+        analyzers.get(view)
+
+  def on_modified(self, view):
+    if is_scss(view):
+      follow_edits(view)
+      if not ASYNC:
+        analyzers.schedule_idle(view)
+
+  def on_load_async(self, view):
+    if is_scss(view):
+      analyzers.schedule(view, 0, save = True)
+      prepare_indexes(view)
+
+  def on_modified_async(self, view):
+    if is_scss(view):
+      analyzers.schedule(view)
+
+  def on_selection_modified_async(self, view):
+    if settings().get('live_selector', False) and is_scss(view):
+      schedule_live_selector(view)
+
+  def on_post_save(self, view):
+    if not ASYNC and is_scss(view):
+      import_graphs.refresh(view.window())
+      extend_indexes.refresh(view.window())
+      selector_indexes.refresh(view.window())
+      report_duplicates(view)
+
+  def on_post_save_async(self, view):
+    if is_scss(view):
+      analyzers.schedule(view, 0, save = True)
+      import_graphs.refresh(view.window())
+      extend_indexes.refresh(view.window())
+      selector_indexes.refresh(view.window())
+      report_duplicates(view)
+
+  def on_close(self, view):
+    analyzers.discard(view)
+    live_updates.pop(view.id(), None)
+
+# Sublime Text 4 reports each edit, so the analysis can follow the typing.
+# Which change count the edit made is only known as it happens; the
+# splice itself waits for the async thread. The listener is attached to
+# SCSS buffers by follow_edits() as they are loaded or first edited,
+# which also catches buffers given the SCSS syntax after they were made;
+# is_applicable() stays False so that Sublime does not attach a second one.
+if hasattr(sublime_plugin, 'TextChangeListener'):
+  class ScssexpanderChangeListener(sublime_plugin.TextChangeListener):
+    def on_text_changed(self, changes):
+      view = self.buffer.primary_view()
+      if view is not None and is_scss(view):
+        change_count = view.change_count()
+        sublime.set_timeout_async(lambda: analyzers.apply(view, changes, change_count), 0)
+
+  change_listeners = {} # buffer id -> listener attached to it
+
+  def follow_edits(view):
+    buffer = view.buffer()
+    listener = change_listeners.get(buffer.id())
+    if listener is not None and listener.is_attached():
+      return
+    # forget the listeners of buffers that have been closed
+    for buffer_id, closed in list(change_listeners.items()):
+      if not closed.is_attached():
+        del change_listeners[buffer_id]
+    listener = change_listeners[buffer.id()] = ScssexpanderChangeListener()
+    listener.attach(buffer)
+else:
+  def follow_edits(view):
+    pass
 
 class ScssexpanderCommand(sublime_plugin.TextCommand):
   def run(self, edit):
-    curpos = self.view.sel()[0].begin()
-    expander = SCSSExpand(curpos, self.view.substr, '\n')
-    status = expander.coalesce_rule()
+    positions = [region.begin() for region in self.view.sel()]
+    if not positions:
+      return
+    stats = expand_stats()
+    analyzer = analyzers.get(self.view, stats)
+    buffer = ViewBuffer(self.view)
+    expander = SCSSExpand(positions[0], buffer.char_at, '\n', analyzer,
+                          settings().get('max_selectors', 50), analyzers.expansion_cache(self.view),
+                          stats, import_context(self.view), extend_index(self.view))
+    rules = expander.coalesce_rules(positions)
+    report_stats(stats)
+    if len(rules) == 1:
+      status = rules[0]
+    else:
+      # label each rule with the line of its cursor
+      status = '\n\n'.join('Line %d:\n%s' % (self.view.rowcol(pos)[0] + 1, rule)
+                            for pos, rule in zip(positions, rules))
     sublime.message_dialog(status)
+
+def show_output_panel(window, name, text):
+  if hasattr(window, 'create_output_panel'):
+    panel = window.create_output_panel(name)
+    panel.run_command('append', {'characters': text})
+  else:
+    panel = window.get_output_panel(name)
+    edit = panel.begin_edit()
+    panel.insert(edit, 0, text)
+    panel.end_edit(edit)
+  window.run_command('show_panel', {'panel': 'output.' + name})
+
+# Lists the compiled selectors of every rule in the file in an output panel
+class ScssexpanderAllCommand(sublime_plugin.TextCommand):
+  def run(self, edit):
+    stats = expand_stats()
+    analyzer = analyzers.get(self.view, stats)
+    buffer = ViewBuffer(self.view)
+    expander = SCSSExpand(0, buffer.char_at, ' ', analyzer,
+                          settings().get('max_selectors', 50), analyzers.expansion_cache(self.view),
+                          stats, import_context(self.view), extend_index(self.view))
+    lines = []
+    for start, end, selectors in expander.expand_all():
+      lines.append('%d: %s' % (self.view.rowcol(start)[0] + 1, ', '.join(selectors)))
+    report_stats(stats)
+    show_output_panel(self.view.window(), 'scss_expander', '\n'.join(lines))
+
+# Asks for a selector as it appears in the compiled CSS, say from the
+# browser's inspector, and lists the rules in the project that produce it
+class ScssexpanderFindCommand(sublime_plugin.WindowCommand):
+  def run(self):
+    self.window.show_input_panel('Compiled selector:', '', self.find, None, None)
+
+  def find(self, selector):
+    index = selector_indexes.get(self.window, lambda: self.find(selector))
+    if index is None:
+      index_unavailable(selector_indexes, self.window, 'open a folder to search for selectors')
+      return
+    self.locations = index.lookup(selector)
+    if not self.locations:
+      sublime.status_message('SCSS Expander: nothing compiles to %s' % selector)
+      return
+    items = [[os.path.basename(path), '%s:%d' % (path, line)] for path, offset, line in self.locations]
+    self.window.show_quick_panel(items, self.open)
+
+  def open(self, number):
+    if number < 0:
+      return
+    path, offset, line = self.locations[number]
+    self.window.open_file('%s:%d' % (path, line), sublime.ENCODED_POSITION)
+
+# Jumps to a rule by any selector it compiles to, from a quick panel of
+# every expanded selector in the file, or with project set in the
+# project's folders. The listings are kept until the file changes or a
+# file in the project is saved, and the panel's own fuzzy matching
+# searches them.
+class ScssexpanderGotoCommand(sublime_plugin.TextCommand):
+  def run(self, edit, project = False):
+    window = self.view.window()
+    if project:
+      index = selector_indexes.get(window, lambda: self.view.run_command('scssexpander_goto', {'project': True}))
+      if index is None:
+        index_unavailable(selector_indexes, window, 'open a folder to list its selectors')
+        return
+      self.targets = index.symbols()
+      items = [[selector, '%s:%d' % (os.path.basename(path), line)]
+               for path, offset, line, selector in self.targets]
+      window.show_quick_panel(items, self.open)
+      return
+
+    self.targets = analyzers.symbols(self.view)
+    items = [[selector, 'line %d' % line] for offset, line, selector in self.targets]
+    self.viewport = self.view.viewport_position()
+    if ASYNC:
+      window.show_quick_panel(items, self.jump, 0, -1, self.preview)
+    else:
+      window.show_quick_panel(items, self.jump)
+
+  def preview(self, number):
+    if number >= 0:
+      self.view.show_at_center(self.targets[number][0])
+
+  def jump(self, number):
+    if number < 0:
+      self.view.set_viewport_position(self.viewport, False)
+      return
+    offset = self.targets[number][0]
+    self.view.sel().clear()
+    self.view.sel().add(sublime.Region(offset))
+    self.view.show_at_center(offset)
+
+  def open(self, number):
+    if number >= 0:
+      path, offset, line, selector = self.targets[number]
+      self.view.window().open_file('%s:%d' % (path, line), sublime.ENCODED_POSITION)
+
+# Lists every selector that more than one rule in the project compiles
+# to, with where each of those rules is, in an output panel
+class ScssexpanderDuplicatesCommand(sublime_plugin.WindowCommand):
+  def run(self):
+    index = selector_indexes.get(self.window, lambda: self.window.run_command('scssexpander_duplicates'))
+    if index is None:
+      index_unavailable(selector_indexes, self.window, 'open a folder to look for duplicate selectors')
+      return
+    # files may have changed outside Sublime; only those are read again
+    in_background(lambda: self.list(index))
+
+  def list(self, index):
+    index.refresh()
+    lines = []
+    for selector, entries in index.duplicates():
+      lines.append(selector)
+      lines.extend('  %s:%d' % (path, line) for path, offset, line in entries)
+    if not lines:
+      sublime.status_message('SCSS Expander: no selector is defined twice')
+      return
+    show_output_panel(self.window, 'scss_expander', '\n'.join(lines))
@@ -0,0 +1,8 @@
+import sys
+
+if sys.version < '3':
+  from src.src_two.cli import main
+else:
+  from src.src_three.cli import main
+
+sys.exit(main())
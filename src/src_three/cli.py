@@ -0,0 +1,154 @@
+import io, json, optparse, os, sys
+from bisect import bisect_right
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from .scss_expand import SCSSExpand
+from .buffer_provider import StringBuffer, MappedBuffer
+from .index_store import IndexStore
+from .selector_index import canonical, find_duplicates
+from .server import serve
+
+EXTENSIONS = ('.scss',)
+
+# The files named on the command line, with directories searched for SCSS
+# files in a stable order; '-' stands for standard input and is kept as is
+def find_files(paths):
+  for path in paths:
+    if path != '-' and os.path.isdir(path):
+      for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+          if name.endswith(EXTENSIONS):
+            yield os.path.join(root, name)
+    else:
+      yield path
+
+def newlines(text):
+  offsets = []
+  pos = text.find('\n')
+  while pos >= 0:
+    offsets.append(pos)
+    pos = text.find('\n', pos + 1)
+  return offsets
+
+# One record per rule: where its block opens and closes, the line of
+# the opening brace counting from 1, and its expanded selectors.
+# breaks are the offsets of the buffer's newlines. With a store, the
+# analysis is looked up under key before the buffer is read at all.
+def expand_buffer(name, buffer, breaks, max_selectors = None, store = None, key = None):
+  analyzer = None
+  if store is not None:
+    analyzer = store.analyzer(key, buffer.char_at, buffer.size())
+  expander = SCSSExpand(0, buffer.char_at, analyzer = analyzer, max_selectors = max_selectors)
+  records = []
+  for start, end, selectors in expander.expand_all(buffer.size()):
+    records.append({'file': name, 'offset': start, 'end': end,
+                    'line': bisect_right(breaks, start - 1) + 1,
+                    'selectors': [buffer.decode(selector) for selector in selectors]})
+  return records
+
+def expand_text(name, text, max_selectors = None, store = None):
+  key = store.key(text) if store is not None else None
+  return expand_buffer(name, StringBuffer(text), newlines(text), max_selectors, store, key)
+
+# Offsets in the records of a mapped file count bytes, not characters
+def expand_mapped(path, max_selectors = None, store = None):
+  with MappedBuffer(path) as buffer:
+    key = store.key(buffer.data) if store is not None else None
+    return expand_buffer(path, buffer, buffer.newlines(), max_selectors, store, key)
+
+def read_file(path):
+  if path == '-':
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    return stdin.read().decode('utf-8')
+  with io.open(path, encoding = 'utf-8') as handle:
+    return handle.read()
+
+# Runs in the worker processes; a file that cannot be read gives a
+# single record carrying the error instead
+def expand_file(path, max_selectors = None, mapped = False, store = None):
+  try:
+    if mapped and path != '-':
+      return expand_mapped(path, max_selectors, store)
+    text = read_file(path)
+  except (IOError, OSError, UnicodeDecodeError) as error:
+    return [{'file': path, 'error': str(error)}]
+  return expand_text(path, text, max_selectors, store)
+
+def expand_files(paths, jobs, max_selectors = None, mapped = False, store = None):
+  # standard input can only be read here, and one file is not worth a pool
+  if jobs <= 1 or len(paths) <= 1 or '-' in paths:
+    work = partial(expand_file, max_selectors = max_selectors, mapped = mapped, store = store)
+    for path in paths:
+      yield work(path)
+    return
+  # the workers leave the cache to be trimmed here, once, at the end
+  workers_store = store.for_workers() if store is not None else None
+  work = partial(expand_file, max_selectors = max_selectors, mapped = mapped, store = workers_store)
+  pool = Pool(min(jobs, len(paths)))
+  try:
+    for records in pool.imap(work, paths, chunksize = 4):
+      yield records
+  finally:
+    pool.terminate()
+  if store is not None:
+    store.evict()
+
+def main(argv = None, out = None):
+  parser = optparse.OptionParser(prog = 'python -m src.__main__', usage = '%prog [options] [path ...]',
+    description = "Print the expanded selector of every rule in SCSS files as JSON Lines. "
+                  "Each path is a file or a directory to expand; '-' reads standard input (the default).")
+  parser.add_option('-j', '--jobs', type = 'int', default = cpu_count(),
+                    help = 'worker processes (default: one per CPU)')
+  parser.add_option('--max-selectors', type = 'int', default = None,
+                    help = 'most selectors to list per rule (default: all)')
+  parser.add_option('--mmap', action = 'store_true', default = False,
+                    help = 'map files into memory rather than reading them, for very large files; '
+                           'offsets are then counted in bytes')
+  parser.add_option('--cache', metavar = 'DIRECTORY',
+                    help = 'keep the analysis of every file in DIRECTORY and reuse it while the file is unchanged')
+  parser.add_option('--cache-size', type = 'int', default = 64, metavar = 'MIB',
+                    help = 'most megabytes the cache may take up (default: 64)')
+  parser.add_option('--find', action = 'append', metavar = 'SELECTOR',
+                    help = 'only list the rules that compile to SELECTOR, as written in the CSS; may be repeated')
+  parser.add_option('--duplicates', action = 'store_true', default = False,
+                    help = 'instead of the rules, list the selectors that more than one rule compiles to, '
+                           'with where each rule is; exits with 1 if there are any')
+  parser.add_option('--serve', action = 'store_true', default = False,
+                    help = 'answer JSON-RPC requests about documents sent over standard input instead, '
+                           'one message per line')
+  args, paths = parser.parse_args(argv)
+  out = out if out is not None else sys.stdout
+  if args.serve:
+    return serve(getattr(sys.stdin, 'buffer', sys.stdin), out, args.max_selectors)
+
+  failed = False
+  store = None
+  if args.cache:
+    store = IndexStore(args.cache, args.cache_size * 1024 * 1024)
+  wanted = set(canonical(selector) for selector in args.find or ())
+  paths = list(find_files(paths or ['-']))
+  locations = {} # selector -> [(file, offset, line)], for --duplicates
+  for records in expand_files(paths, args.jobs, args.max_selectors, args.mmap, store):
+    for record in records:
+      failed = failed or 'error' in record
+      if 'error' not in record:
+        if wanted:
+          found = [selector for selector in record['selectors'] if canonical(selector) in wanted]
+          if not found:
+            continue
+          record = dict(record, selectors = found)
+        if args.duplicates:
+          for selector in record['selectors']:
+            locations.setdefault(canonical(selector), []).append((record['file'], record['offset'], record['line']))
+          continue
+      out.write(json.dumps(record, sort_keys = True) + '\n')
+
+  if args.duplicates:
+    duplicates = find_duplicates(locations)
+    for selector, entries in duplicates:
+      record = {'selector': selector,
+                'locations': [{'file': name, 'offset': offset, 'line': line} for name, offset, line in entries]}
+      out.write(json.dumps(record, sort_keys = True) + '\n')
+    failed = failed or bool(duplicates)
+  return 1 if failed else 0
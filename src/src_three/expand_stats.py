@@ -0,0 +1,76 @@
+import time
+
+try:
+  timer = time.perf_counter
+except AttributeError:
+  timer = time.time
+
+# Counters for one or more expansions, filled in by SCSSExpand when it is
+# handed an instance. phases maps each phase to the wall time spent in it
+# (seconds) and calls to how often it ran. char_reads counts characters
+# read from the text, whether one get_char_fn call at a time or a window
+# at once, comment_lookups the times a cursor was checked against
+# comments, strings and interpolation, and the expansion counters give
+# the fan-out: combinations produced, selectors shown and left out.
+class ExpandStats():
+  def __init__(self):
+    self.phases = {}
+    self.calls = {}
+    self.queries = 0
+    self.char_reads = 0
+    self.comment_lookups = 0
+    self.expanded_count = 0
+    self.selector_count = 0
+    self.omitted_count = 0
+
+  def phase(self, name):
+    return PhaseTimer(self, name)
+
+  def add_time(self, name, elapsed):
+    self.phases[name] = self.phases.get(name, 0.0) + elapsed
+    self.calls[name] = self.calls.get(name, 0) + 1
+
+  def total_time(self):
+    return sum(self.phases.values())
+
+  # One line, short enough for a status bar
+  def summary(self):
+    phases = ', '.join('%s %.2fms' % (name, self.phases[name] * 1000) for name in sorted(self.phases))
+    return 'SCSS Expander: %s; %d chars read, %d comment lookups, %d/%d selectors' % (
+      phases or 'no phases', self.char_reads, self.comment_lookups,
+      self.selector_count, self.expanded_count)
+
+  def __str__(self):
+    lines = ['SCSS Expander stats for %d %s' % (self.queries, 'query' if self.queries == 1 else 'queries')]
+    for name in sorted(self.phases):
+      lines.append('  %-18s %9.3f ms  (%d calls)' % (name, self.phases[name] * 1000, self.calls[name]))
+    lines.append('  chars read         %d' % self.char_reads)
+    lines.append('  comment lookups    %d' % self.comment_lookups)
+    lines.append('  expanded           %d combinations, %d shown, %d left out' % (
+      self.expanded_count, self.selector_count, self.omitted_count))
+    return '\n'.join(lines)
+
+class PhaseTimer(object):
+  __slots__ = ('stats', 'name', 'began')
+
+  def __init__(self, stats, name):
+    self.stats = stats
+    self.name = name
+
+  def __enter__(self):
+    self.began = timer()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.stats.add_time(self.name, timer() - self.began)
+    return False
+
+# Stands in for a PhaseTimer when nothing is being recorded
+class NoPhase(object):
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    return False
+
+no_phase = NoPhase()
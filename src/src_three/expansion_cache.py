@@ -0,0 +1,58 @@
+# A bounded least-recently-used mapping, used to remember the expanded
+# selectors of blocks between queries. Keys carry the version of the text
+# they were computed from, so entries for old versions simply age out.
+# Entries are [previous, next, key, value] links in a ring around a
+# sentinel, least recently used first, so that moving one to the end or
+# dropping the oldest takes constant time; OrderedDict would do the same
+# but is not in Python 2.6.
+class ExpansionCache():
+  def __init__(self, capacity = 256):
+    self.capacity = capacity
+    self.links = {} # key -> link
+    self.root = []
+    self.root[:] = [self.root, self.root, None, None]
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    link = self.links.get(key)
+    if link is None:
+      self.misses += 1
+      return None
+    self.unlink(link)
+    self.append(link)
+    self.hits += 1
+    return link[3]
+
+  def put(self, key, value):
+    link = self.links.get(key)
+    if link is not None:
+      self.unlink(link)
+    link = self.links[key] = [None, None, key, value]
+    self.append(link)
+    while len(self.links) > self.capacity:
+      oldest = self.root[1]
+      self.unlink(oldest)
+      del self.links[oldest[2]]
+
+  def unlink(self, link):
+    link[0][1] = link[1]
+    link[1][0] = link[0]
+
+  # Puts a link at the most recently used end
+  def append(self, link):
+    last = self.root[0]
+    link[0] = last
+    link[1] = self.root
+    last[1] = link
+    self.root[0] = link
+
+  def clear(self):
+    self.links.clear()
+    self.root[:] = [self.root, self.root, None, None]
+
+  def __len__(self):
+    return len(self.links)
+
+  def __contains__(self, key):
+    return key in self.links
@@ -0,0 +1,68 @@
+import re
+from .project_index import ProjectIndex
+
+EXTEND_RE = re.compile(r'@extend\s+([^;{}]+)')
+# The class, id and placeholder selectors in a selector, which are what
+# @extend can name
+SIMPLE_RE = re.compile(r'[.#%][\w-]+')
+
+# Which rules @extend which selectors, across the project.
+#   files     path -> (mtime, [(target, offset, line, selectors)])
+#   extenders target -> [(path, offset, line, selectors)]
+# target is what follows @extend, such as .button or %placeholder, and
+# selectors are the expanded selectors of the rule doing the extending.
+class ExtendIndex(ProjectIndex):
+  # The most selectors extend() adds for one rule; extensions of
+  # extensions can multiply quickly
+  limit = 200
+
+  def __init__(self, folders, extensions = ('.scss',)):
+    ProjectIndex.__init__(self, folders, extensions)
+    self.extenders = {}
+
+  def rebuild(self):
+    self.extenders = {}
+    for path, (mtime, extends) in self.files.items():
+      for target, offset, line, selectors in extends:
+        self.extenders.setdefault(target, []).append((path, offset, line, selectors))
+    for entries in self.extenders.values():
+      entries.sort()
+
+  def scan(self, path):
+    text = self.read(path)
+    if text is None or '@extend' not in text:
+      return []
+    extends = []
+    for match, offset, line, selectors in self.statements(text, EXTEND_RE):
+      # an @extend outside any rule extends nothing
+      if not selectors:
+        continue
+      for target in match.group(1).replace('!optional', '').split(','):
+        target = target.strip()
+        if target:
+          extends.append((target, offset, line, selectors))
+    return extends
+
+  # The selectors @extend adds to a rule with the given selectors: each
+  # class, id or placeholder that something extends is replaced by the
+  # selectors of the rule extending it, and the results are extended in
+  # turn. Selectors still holding a placeholder are not output by Sass and
+  # are left out. Where Sass would interleave an extending rule's ancestors
+  # with the extended one's, only the substitution is given.
+  def extend(self, selectors):
+    results = []
+    seen = set(selectors)
+    pending = list(selectors)
+    while pending and len(results) < self.limit:
+      selector = pending.pop(0)
+      for match in SIMPLE_RE.finditer(selector):
+        for path, offset, line, extenders in self.extenders.get(match.group(), ()):
+          for extender in extenders:
+            extended = selector[:match.start()] + extender + selector[match.end():]
+            if extended in seen:
+              continue
+            seen.add(extended)
+            pending.append(extended)
+            if '%' not in extended:
+              results.append(extended)
+    return results[:self.limit]
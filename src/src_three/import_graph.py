@@ -0,0 +1,86 @@
+import os, re
+from .project_index import ProjectIndex
+
+IMPORT_RE = re.compile(r'@import\s+([^;{}]+)')
+TARGET_RE = re.compile(r'"([^"]+)"|\'([^\']+)\'')
+
+# Which SCSS files import which, and inside which rules.
+#   files     path -> (mtime, [(imported path, offset, line, selectors)])
+#   importers imported path -> [(path, offset, line, selectors)]
+# selectors are those of the rule the @import sits in, [] at the top level.
+class ImportGraph(ProjectIndex):
+  def __init__(self, folders, extensions = ('.scss',)):
+    ProjectIndex.__init__(self, folders, extensions)
+    self.importers = {}
+
+  def rebuild(self):
+    self.importers = {}
+    for path, (mtime, imports) in self.files.items():
+      for target, offset, line, selectors in imports:
+        self.importers.setdefault(target, []).append((path, offset, line, selectors))
+    for entries in self.importers.values():
+      entries.sort()
+
+  # The @imports of one file that resolve to files on disk, with the
+  # expanded selectors of the rule each one is in
+  def scan(self, path):
+    text = self.read(path)
+    if text is None or '@import' not in text:
+      return []
+    imports = []
+    for match, offset, line, selectors in self.statements(text, IMPORT_RE):
+      for target in TARGET_RE.finditer(match.group(1)):
+        imported = self.resolve(path, target.group(1) or target.group(2))
+        if imported is not None:
+          imports.append((imported, offset, line, selectors))
+    return imports
+
+  # Finds the file an import names the way Sass does: next to the importing
+  # file or in a project folder, with or without the leading underscore of
+  # a partial and the extension, or as a folder's index
+  def resolve(self, path, name):
+    if '://' in name or name.endswith('.css'):
+      return None
+    for base in [os.path.dirname(path)] + self.folders:
+      stem = os.path.join(base, name)
+      folder, filename = os.path.split(stem)
+      if name.endswith(self.extensions):
+        candidates = [stem, os.path.join(folder, '_' + filename)]
+      else:
+        candidates = [stem + extension for extension in self.extensions]
+        candidates += [os.path.join(folder, '_' + filename + extension) for extension in self.extensions]
+        candidates += [os.path.join(stem, index + extension)
+                       for index in ('_index', 'index') for extension in self.extensions]
+      for candidate in candidates:
+        if os.path.isfile(candidate):
+          return self.normalise(candidate)
+    return None
+
+  # Every selector the rules of a file end up nested in, following imports
+  # of imports outwards. '' stands for being imported at the top level, so
+  # a partial imported both there and inside a rule keeps its bare form
+  # too. [] when nothing imports it inside a rule.
+  def context(self, path):
+    selectors = self.contexts(self.normalise(path), set())
+    return [] if selectors == [''] else selectors
+
+  # Cycles are cut where they close
+  def contexts(self, path, seen):
+    seen = seen | set([path])
+    results = []
+    for importer, offset, line, selectors in self.importers.get(path, []):
+      if importer in seen:
+        continue
+      for outer in self.contexts(importer, seen):
+        for selector in selectors or ['']:
+          combined = self.combine(outer, selector)
+          if combined not in results:
+            results.append(combined)
+    return results or ['']
+
+  def combine(self, outer, selector):
+    if '&' in selector:
+      return selector.replace('&', outer)
+    if not outer or not selector:
+      return outer or selector
+    return outer + ' ' + selector
@@ -0,0 +1,83 @@
+import io, os, re
+from bisect import bisect_right
+from .buffer_provider import StringBuffer
+from .scss_analyzer import ScssAnalyzer
+from .scss_expand import SCSSExpand
+
+# Something learnt from every SCSS file under a set of project folders.
+# Each file is read once and read again only when its modification time
+# changes; refresh() is what notices, so queries never touch the disk.
+# Subclasses say what to keep from a file in scan(path), which gives a
+# list of entries, and gather the entries of all files together in
+# rebuild().
+#   files  path -> (mtime, entries)
+class ProjectIndex():
+  def __init__(self, folders, extensions = ('.scss',)):
+    self.folders = [self.normalise(folder) for folder in folders]
+    self.extensions = extensions
+    self.files = {}
+
+  def normalise(self, path):
+    return os.path.normcase(os.path.abspath(path))
+
+  # Rescans new and changed files and forgets deleted ones; True if
+  # anything changed
+  def refresh(self):
+    changed = False
+    found = set()
+    for path in self.find_files():
+      found.add(path)
+      try:
+        mtime = os.path.getmtime(path)
+      except OSError:
+        continue
+      entry = self.files.get(path)
+      if entry is None or entry[0] != mtime:
+        self.files[path] = (mtime, self.scan(path))
+        changed = True
+    for path in list(self.files):
+      if path not in found:
+        del self.files[path]
+        changed = True
+    if changed:
+      self.rebuild()
+    return changed
+
+  # Folders are searched; a file given in their place is taken as it is
+  def find_files(self):
+    for folder in self.folders:
+      if os.path.isfile(folder):
+        yield folder
+      for root, dirs, files in os.walk(folder):
+        for name in files:
+          if name.endswith(self.extensions):
+            yield self.normalise(os.path.join(root, name))
+
+  def scan(self, path):
+    raise NotImplementedError
+
+  def rebuild(self):
+    raise NotImplementedError
+
+  def read(self, path):
+    try:
+      with io.open(path, encoding = 'utf-8', errors = 'replace') as handle:
+        return handle.read()
+    except (IOError, OSError):
+      return None
+
+  # (offset, line, expanded selectors of the rule around it) for every
+  # match of regex in text outside comments and strings, along with the
+  # match itself
+  def statements(self, text, regex):
+    buffer = StringBuffer(text)
+    analyzer = ScssAnalyzer(buffer.char_at, buffer.size())
+    breaks = [match.start() for match in re.finditer('\n', text)]
+    for match in regex.finditer(text):
+      offset = match.start()
+      if analyzer.resolve(offset) != offset:
+        continue
+      expander = SCSSExpand(offset, buffer.char_at, analyzer = analyzer)
+      expander.coalesce_rule()
+      selectors = [expander.strip_whitespace(selector) for selector in expander.selectors]
+      yield match, offset, bisect_right(breaks, offset - 1) + 1, selectors
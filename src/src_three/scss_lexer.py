@@ -0,0 +1,353 @@
+import re
+from array import array
+from bisect import bisect_right
+from .comment_index import CommentIndex
+from .buffer_provider import BufferProvider
+
+# Token kinds
+OPEN = 0          # {
+CLOSE = 1         # }
+SEMICOLON = 2     # ;
+TEXT = 3          # a run of anything else: selectors, declarations, whitespace
+COMMENT = 4       # // ... newline or /* ... */
+INTERPOLATION = 5 # #{ ... }
+STRING = 6        # "..." or '...'
+
+# What the windowed scan searches for: anything that can start a token
+# other than text, and what can end each kind of token
+SPECIAL_RE = re.compile(r'[{};/#"\']')
+LINE_END_RE = re.compile(r'\n')
+BLOCK_END_RE = re.compile(r'\*/')
+INTERPOLATION_RE = re.compile(r'[{}"\']')
+STRING_RES = {'"': re.compile(r'["\\\n]'), "'": re.compile(r"['\\\n]")}
+
+# Raised out of tokenize when the caller asks for the work to stop
+class BuildCancelled(Exception):
+  pass
+
+# The tokens of a text, stored column-wise in parallel arrays. Ends are
+# inclusive; a comment, string or interpolation still open when the text
+# runs out ends at the lexed size, one past its last character.
+class TokenStream():
+  def __init__(self, size = 0):
+    self.size = size
+    self.kinds = array('b')
+    self.starts = array('l')
+    self.ends = array('l')
+    self.comments = CommentIndex()
+    # token index of each { -> (start, text) of the statement before it;
+    # the analysis makes its scopes from these, and tokens it has patched
+    # up or read back from disk come without them
+    self.selectors = {}
+
+  def add(self, kind, start, end):
+    self.kinds.append(kind)
+    self.starts.append(start)
+    self.ends.append(end)
+    if kind == COMMENT:
+      self.comments.add(start, end)
+    return len(self.kinds) - 1
+
+  # Index of the last token starting at or before pos, -1 if there is none
+  def index_before(self, pos):
+    return bisect_right(self.starts, pos) - 1
+
+  def __len__(self):
+    return len(self.kinds)
+
+  def __getitem__(self, index):
+    return (self.kinds[index], self.starts[index], self.ends[index])
+
+# Reads a text once, front to back, and splits it into structural tokens.
+# Comments, strings and interpolation are recognised here and nowhere
+# else, so braces inside them never reach the selector logic. While it
+# goes, the lexer keeps the text of the current statement (comments left
+# out) and files it against the { that ends it, which is the selector of
+# the block that { opens.
+# is_cancelled, if given, is asked every cancel_interval characters whether
+# the result is still wanted; once it says no, tokenize raises BuildCancelled.
+# When get_char_fn is a buffer provider's char_at, the lexer reads the
+# provider's text a window of cancel_interval characters at a time and
+# searches it with regular expressions, jumping straight from one
+# interesting character to the next. Otherwise it asks for every
+# character in turn. Both give the same tokens.
+class ScssLexer():
+  cancel_interval = 4096
+
+  def __init__(self, get_char_fn, size, is_cancelled = None):
+    self.get_char_fn = get_char_fn
+    self.size = size
+    self.is_cancelled = is_cancelled
+    provider = getattr(get_char_fn, '__self__', None)
+    self.read_fn = provider.substr if isinstance(provider, BufferProvider) else None
+
+  def tokenize(self):
+    if self.read_fn is not None:
+      return self.scan()
+    return self.step()
+
+  # One character at a time through get_char_fn
+  def step(self):
+    get_char_fn = self.get_char_fn
+    size = self.size
+    tokens = TokenStream(size)
+    statement = []
+    statementstart = 0
+    textstart = None
+    pos = 0
+    is_cancelled = self.is_cancelled
+    next_check = 0 if is_cancelled is not None else size
+
+    while pos < size:
+      if pos >= next_check:
+        if is_cancelled():
+          raise BuildCancelled()
+        next_check = pos + self.cancel_interval
+      char = get_char_fn(pos)
+      nextchar = ''
+      if (char == '/' or char == '#') and pos + 1 < size:
+        nextchar = get_char_fn(pos + 1)
+
+      if char == '/' and (nextchar == '/' or nextchar == '*'):
+        kind, end = COMMENT, self.comment_end(pos, nextchar)
+      elif char == '#' and nextchar == '{':
+        kind, end = INTERPOLATION, self.interpolation_end(pos, statement)
+      elif char == '"' or char == "'":
+        kind, end = STRING, self.string_end(pos, char, statement)
+      elif char == '{':
+        kind, end = OPEN, pos
+      elif char == '}':
+        kind, end = CLOSE, pos
+      elif char == ';':
+        kind, end = SEMICOLON, pos
+      else:
+        if textstart is None:
+          textstart = pos
+        statement.append(char)
+        pos += 1
+        continue
+
+      if textstart is not None:
+        tokens.add(TEXT, textstart, pos - 1)
+        textstart = None
+      index = tokens.add(kind, pos, end)
+
+      if kind == OPEN:
+        tokens.selectors[index] = (statementstart, ''.join(statement))
+      if kind == OPEN or kind == CLOSE or kind == SEMICOLON:
+        statement = []
+        statementstart = pos + 1
+
+      pos = end + 1
+
+    if textstart is not None:
+      tokens.add(TEXT, textstart, size - 1)
+    return tokens
+
+  # A line comment runs up to and including its newline,
+  # a block comment up to and including the closing slash
+  def comment_end(self, pos, kind):
+    get_char_fn = self.get_char_fn
+    size = self.size
+    if kind == '/':
+      pos += 2
+      while pos < size:
+        if get_char_fn(pos) == '\n':
+          return pos
+        pos += 1
+      return size
+
+    pos += 2 # move past the opening block so that /*/ is still commented
+    while pos < size:
+      if get_char_fn(pos) == '*' and pos + 1 < size and get_char_fn(pos + 1) == '/':
+        return pos + 1
+      pos += 1
+    return size
+
+  # Interpolation and strings are part of the statement text, so their
+  # characters are collected as they are read
+  def interpolation_end(self, pos, collect):
+    get_char_fn = self.get_char_fn
+    size = self.size
+    depth = 0
+    collect.append('#{')
+    pos += 2
+    while pos < size:
+      char = get_char_fn(pos)
+      if char == '"' or char == "'":
+        pos = self.string_end(pos, char, collect) + 1
+        continue
+      collect.append(char)
+      if char == '{':
+        depth += 1
+      elif char == '}':
+        if depth == 0:
+          return pos
+        depth -= 1
+      pos += 1
+    return size
+
+  # Strings cannot run over a line, so a newline ends an unclosed one
+  def string_end(self, pos, quote, collect):
+    get_char_fn = self.get_char_fn
+    size = self.size
+    collect.append(quote)
+    pos += 1
+    while pos < size:
+      char = get_char_fn(pos)
+      if char == '\n':
+        return pos - 1
+      collect.append(char)
+      if char == quote:
+        return pos
+      elif char == '\\' and pos + 1 < size:
+        pos += 1
+        collect.append(get_char_fn(pos))
+      pos += 1
+    return size
+
+  ### The windowed scan. self.text holds the characters from self.base up
+  ### to self.loaded; it grows a window at a time while a token is being
+  ### searched for and is dropped once the scan has moved past all of it.
+
+  def scan(self):
+    size = self.size
+    tokens = TokenStream(size)
+    statement = []
+    statementstart = 0
+    textstart = None
+    pos = 0
+    self.text = ''
+    self.base = 0
+    self.loaded = 0
+
+    while pos < size:
+      offset = pos - self.base
+      if offset >= len(self.text):
+        self.text = ''
+        self.base = self.loaded
+        self.load()
+        offset = pos - self.base
+      match = SPECIAL_RE.search(self.text, offset)
+      stop = self.base + (match.start() if match else len(self.text))
+      if stop > pos:
+        if textstart is None:
+          textstart = pos
+        statement.append(self.text[offset:stop - self.base])
+        pos = stop
+        continue
+
+      char = match.group()
+      nextchar = ''
+      if char == '/' or char == '#':
+        nextchar = self.char(pos + 1)
+
+      if char == '/' and (nextchar == '/' or nextchar == '*'):
+        kind, end = COMMENT, self.comment_span(pos, nextchar)
+      elif char == '#' and nextchar == '{':
+        kind, end = INTERPOLATION, self.interpolation_span(pos)
+      elif char == '"' or char == "'":
+        kind, end = STRING, self.string_span(pos, char)
+      elif char == '{':
+        kind, end = OPEN, pos
+      elif char == '}':
+        kind, end = CLOSE, pos
+      elif char == ';':
+        kind, end = SEMICOLON, pos
+      else:
+        if textstart is None:
+          textstart = pos
+        statement.append(char)
+        pos += 1
+        continue
+
+      if kind == INTERPOLATION or kind == STRING:
+        statement.append(self.text[pos - self.base:min(end + 1, size) - self.base])
+      if textstart is not None:
+        tokens.add(TEXT, textstart, pos - 1)
+        textstart = None
+      index = tokens.add(kind, pos, end)
+
+      if kind == OPEN:
+        tokens.selectors[index] = (statementstart, ''.join(statement))
+      if kind == OPEN or kind == CLOSE or kind == SEMICOLON:
+        statement = []
+        statementstart = pos + 1
+
+      pos = end + 1
+
+    if textstart is not None:
+      tokens.add(TEXT, textstart, size - 1)
+    return tokens
+
+  # Reads the next window onto the end of self.text; False at the end
+  def load(self):
+    if self.loaded >= self.size:
+      return False
+    if self.is_cancelled is not None and self.is_cancelled():
+      raise BuildCancelled()
+    end = min(self.loaded + self.cancel_interval, self.size)
+    self.text += self.read_fn(self.loaded, end)
+    self.loaded = end
+    return True
+
+  def char(self, pos):
+    while pos >= self.loaded and self.load():
+      pass
+    if pos >= self.loaded:
+      return ''
+    return self.text[pos - self.base]
+
+  # Offset of the first match of regex at or after pos, reading on as far
+  # as needed; -1 if the text ends first. overlap is how many characters
+  # before a window's end a match may start and still run into the next.
+  def search(self, regex, pos, overlap = 0):
+    while True:
+      match = regex.search(self.text, pos - self.base)
+      if match:
+        return self.base + match.start()
+      pos = max(pos, self.loaded - overlap)
+      if not self.load():
+        return -1
+
+  def comment_span(self, pos, kind):
+    if kind == '/':
+      end = self.search(LINE_END_RE, pos + 2)
+      return end if end >= 0 else self.size
+    end = self.search(BLOCK_END_RE, pos + 2, 1)
+    return end + 1 if end >= 0 else self.size
+
+  def interpolation_span(self, pos):
+    depth = 0
+    pos += 2
+    while True:
+      end = self.search(INTERPOLATION_RE, pos)
+      if end < 0:
+        return self.size
+      char = self.text[end - self.base]
+      if char == '"' or char == "'":
+        pos = self.string_span(end, char) + 1
+        continue
+      if char == '{':
+        depth += 1
+      elif depth == 0:
+        return end
+      else:
+        depth -= 1
+      pos = end + 1
+
+  def string_span(self, pos, quote):
+    pos += 1
+    while True:
+      end = self.search(STRING_RES[quote], pos)
+      if end < 0:
+        return self.size
+      char = self.text[end - self.base]
+      if char == '\n':
+        return end - 1
+      if char == quote:
+        return end
+      # a backslash escapes whatever follows it
+      if end + 1 >= self.size:
+        return self.size
+      pos = end + 2
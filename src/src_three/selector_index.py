@@ -0,0 +1,85 @@
+import re
+from bisect import bisect_right
+from .buffer_provider import StringBuffer
+from .scss_expand import SCSSExpand
+from .project_index import ProjectIndex
+
+COMBINATOR_RE = re.compile(r'\s*([>+~])\s*')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# A selector written the one way the index stores it, so that
+# ".a>.b" and ".a  > .b" from DevTools or a stylesheet both find it
+def canonical(selector):
+  selector = COMBINATOR_RE.sub(r' \1 ', selector)
+  return WHITESPACE_RE.sub(' ', selector).strip()
+
+# The selectors more than one rule compiles to, each with the rules'
+# (path, offset, line) in order, from a mapping of selectors to such
+# lists; a rule listed twice for a selector counts once
+def find_duplicates(locations):
+  duplicates = []
+  for selector, entries in locations.items():
+    entries = sorted(set(entries))
+    if len(entries) > 1:
+      duplicates.append((selector, entries))
+  duplicates.sort()
+  return duplicates
+
+# Where each compiled selector comes from, across the project.
+#   files     path -> (mtime, [(selector, offset, line)])
+#   locations selector -> [(path, offset, line)]
+# offset is that of the { of the rule and line is its line, counting from 1.
+class SelectorIndex(ProjectIndex):
+  # The most selectors kept for any one rule
+  limit = 1000
+
+  def __init__(self, folders, extensions = ('.scss',)):
+    ProjectIndex.__init__(self, folders, extensions)
+    self.locations = {}
+    self.listing = None
+
+  def rebuild(self):
+    self.locations = {}
+    self.listing = None
+    for path, (mtime, selectors) in self.files.items():
+      for selector, offset, line in selectors:
+        self.locations.setdefault(selector, []).append((path, offset, line))
+    for entries in self.locations.values():
+      entries.sort()
+
+  def scan(self, path):
+    text = self.read(path)
+    if text is None:
+      return []
+    buffer = StringBuffer(text)
+    breaks = [match.start() for match in re.finditer('\n', text)]
+    selectors = []
+    expander = SCSSExpand(0, buffer.char_at, max_selectors = self.limit)
+    for start, end, expanded in expander.expand_all(buffer.size()):
+      line = bisect_right(breaks, start - 1) + 1
+      for selector in expanded:
+        selectors.append((canonical(selector), start, line))
+    return selectors
+
+  # Every rule that compiles to the selector, [] if none does
+  def lookup(self, selector):
+    return self.locations.get(canonical(selector), [])
+
+  # The selectors defined by more than one rule in the project; with a
+  # path, only those that file has a part in
+  def duplicates(self, path = None):
+    duplicates = find_duplicates(self.locations)
+    if path is not None:
+      path = self.normalise(path)
+      duplicates = [(selector, entries) for selector, entries in duplicates
+                    if any(entry[0] == path for entry in entries)]
+    return duplicates
+
+  # Every (path, offset, line, selector) in the project in file order,
+  # worked out once after each rebuild for listing them all
+  def symbols(self):
+    if self.listing is None:
+      self.listing = sorted((path, offset, line, selector)
+                            for selector, entries in self.locations.items()
+                            for path, offset, line in entries)
+    return self.listing
@@ -0,0 +1,184 @@
+import codecs, mmap
+
+# Buffer providers give the expander indexed access to a piece of text.
+# char_at is what gets handed to SCSSExpand as its get_char_fn; reading
+# past either end of the buffer gives '\x00', as Sublime's view.substr does.
+class BufferProvider():
+  def size(self):
+    raise NotImplementedError
+
+  def char_at(self, pos):
+    raise NotImplementedError
+
+  # Text between start (inclusive) and end (exclusive)
+  def substr(self, start, end):
+    raise NotImplementedError
+
+  # The same span as readable text. Providers whose characters stand for
+  # something else, such as the bytes of MappedBuffer, decode it here.
+  def text(self, start, end):
+    return self.decode(self.substr(start, end))
+
+  # Turns characters read from the buffer, or strings built from them,
+  # into readable text
+  def decode(self, characters):
+    return characters
+
+  def __len__(self):
+    return self.size()
+
+  def __getitem__(self, pos):
+    return self.char_at(pos)
+
+# The trivial provider: the whole text is already in memory
+class StringBuffer(BufferProvider):
+  def __init__(self, text):
+    self.text = text
+
+  def size(self):
+    return len(self.text)
+
+  def char_at(self, pos):
+    if 0 <= pos < len(self.text):
+      return self.text[pos]
+    return '\x00'
+
+  def substr(self, start, end):
+    return self.text[max(start, 0):end]
+
+# Another provider with every character read from it counted in the
+# char_reads of an ExpandStats, whether read alone or a window at a time.
+# Being a provider itself, it still lets the lexer scan a window at a time.
+class CountedBuffer(BufferProvider):
+  def __init__(self, provider, stats):
+    self.provider = provider
+    self.stats = stats
+
+  def size(self):
+    return self.provider.size()
+
+  def char_at(self, pos):
+    self.stats.char_reads += 1
+    return self.provider.char_at(pos)
+
+  def substr(self, start, end):
+    text = self.provider.substr(start, end)
+    self.stats.char_reads += len(text)
+    return text
+
+  def decode(self, characters):
+    return self.provider.decode(characters)
+
+# Reads the underlying buffer in fixed-size, aligned windows through
+# read_fn(start, end) and caches them, so walking backwards or forwards
+# over the text costs one read per window rather than one per character.
+# Subclasses supply size() and read(start, end).
+class ChunkedBuffer(BufferProvider):
+  def __init__(self, chunk_size = 4096):
+    self.chunk_size = chunk_size
+    self.chunks = {} # window number -> text
+    self.chunk = ''
+    self.chunk_start = 0
+
+  def read(self, start, end):
+    raise NotImplementedError
+
+  def window(self, number):
+    chunk = self.chunks.get(number)
+    if chunk is None:
+      start = number * self.chunk_size
+      chunk = self.read(start, min(start + self.chunk_size, self.size()))
+      self.chunks[number] = chunk
+    return chunk
+
+  def char_at(self, pos):
+    # most accesses land in the same window as the previous one
+    offset = pos - self.chunk_start
+    if 0 <= offset < len(self.chunk):
+      return self.chunk[offset]
+    if pos < 0 or pos >= self.size():
+      return '\x00'
+    number = pos // self.chunk_size
+    self.chunk = self.window(number)
+    self.chunk_start = number * self.chunk_size
+    return self.chunk[pos - self.chunk_start]
+
+  def substr(self, start, end):
+    start = max(start, 0)
+    end = min(end, self.size())
+    if start >= end:
+      return ''
+    first = start // self.chunk_size
+    last = (end - 1) // self.chunk_size
+    text = ''.join(self.window(number) for number in range(first, last + 1))
+    offset = first * self.chunk_size
+    return text[start - offset:end - offset]
+
+# Maps a file into memory instead of reading it. Every byte is one
+# character, decoded as latin-1 a window at a time, so offsets are byte
+# offsets and no more than one window is ever held as a string. Everything
+# the expander looks for is ASCII, which no byte of a multi-byte UTF-8
+# character can be mistaken for; text() and decode() give real text back,
+# UTF-8 decoded, for the spans that are shown.
+class MappedBuffer(ChunkedBuffer):
+  def __init__(self, path, chunk_size = 65536, encoding = 'utf-8'):
+    ChunkedBuffer.__init__(self, chunk_size)
+    self.encoding = encoding
+    self.handle = open(path, 'rb')
+    try:
+      self.mapping = mmap.mmap(self.handle.fileno(), 0, access = mmap.ACCESS_READ)
+    except ValueError:
+      # an empty file cannot be mapped
+      self.mapping = None
+    if self.mapping is None:
+      self.data = b''
+    else:
+      try:
+        self.data = memoryview(self.mapping)
+      except (NameError, TypeError):
+        # Python 2.6 has no memoryview and Python 2.7 cannot make one of an
+        # mmap; their mmaps are sliced directly, copying one window at a time
+        self.data = self.mapping
+    self.length = len(self.data)
+
+  def size(self):
+    return self.length
+
+  def read(self, start, end):
+    return codecs.latin_1_decode(self.data[start:end])[0]
+
+  # The lexer goes through the file once, so windows are not kept around
+  def window(self, number):
+    start = number * self.chunk_size
+    return self.read(start, min(start + self.chunk_size, self.length))
+
+  def decode(self, characters):
+    return characters.encode('latin-1').decode(self.encoding, 'replace')
+
+  # Offsets of every newline, found in the mapping without decoding it
+  def newlines(self):
+    offsets = []
+    if self.mapping is None:
+      return offsets
+    pos = self.mapping.find(b'\n')
+    while pos >= 0:
+      offsets.append(pos)
+      pos = self.mapping.find(b'\n', pos + 1)
+    return offsets
+
+  def close(self):
+    # a memoryview has to let go of the mapping before it can be closed
+    if hasattr(self.data, 'release'):
+      self.data.release()
+    self.data = b''
+    if self.mapping is not None:
+      self.mapping.close()
+      self.mapping = None
+    self.handle.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+    return False
@@ -0,0 +1,42 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Sorted, non-overlapping comment intervals kept in two parallel arrays.
+# Both ends are inclusive, so /*123*/ at offset 0 is stored as (0, 6).
+# Because the intervals never overlap, the starts and the ends are each
+# sorted on their own and every lookup is a single bisect.
+class CommentIndex():
+  def __init__(self, blocks = ()):
+    self.starts = array('l')
+    self.ends = array('l')
+    for start, end in blocks:
+      self.add(start, end)
+
+  def add(self, start, end):
+    if len(self.starts) and start <= self.ends[-1]:
+      raise ValueError('comment (%d, %d) overlaps or precedes the last comment' % (start, end))
+    self.starts.append(start)
+    self.ends.append(end)
+
+  # Returns the start of the comment containing pos, or None
+  def containing(self, pos):
+    index = bisect_right(self.starts, pos) - 1
+    if index >= 0 and pos <= self.ends[index]:
+      return self.starts[index]
+    return None
+
+  # Returns the start of the comment whose last character is at pos, or None
+  def ending_at(self, pos):
+    index = bisect_left(self.ends, pos)
+    if index < len(self.ends) and self.ends[index] == pos:
+      return self.starts[index]
+    return None
+
+  def __len__(self):
+    return len(self.starts)
+
+  def __getitem__(self, index):
+    return (self.starts[index], self.ends[index])
+
+  def __iter__(self):
+    return iter(zip(self.starts, self.ends))
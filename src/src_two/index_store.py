@@ -0,0 +1,177 @@
+import hashlib, json, os, tempfile, zlib
+from array import array
+from scss_analyzer import ScssAnalyzer, AssembledAnalyzer
+from scss_lexer import TokenStream
+from scope_node import ScopeNode
+from shifted_array import plain
+
+# Bumped whenever what an analysis holds, or how it is written, changes;
+# files written in another format are never read
+FORMAT = 2
+
+# The arrays of an analysis, in the order they are written
+ARRAYS = [('kinds', 'b'), ('starts', 'l'), ('ends', 'l'), ('comment_starts', 'l'),
+          ('comment_ends', 'l'), ('opens', 'l'), ('closes', 'l'), ('parents', 'l'),
+          ('depths', 'B'), ('open_tokens', 'l')]
+
+def to_bytes(values):
+  return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+def from_bytes(typecode, data):
+  values = array(typecode)
+  if hasattr(values, 'frombytes'):
+    values.frombytes(data)
+  else:
+    values.fromstring(data)
+  return values
+
+# Analyses kept on disk between sessions, one zlib-compressed file each,
+# named after a hash of the text they were built from. A file holds a JSON
+# header line (format, sizes, the span and text of each block's selector)
+# followed by the raw
+# bytes of the arrays. Once the files take up more than max_bytes, those
+# used longest ago are deleted; loading a file marks it as used.
+class IndexStore():
+  def __init__(self, directory, max_bytes = 64 * 1024 * 1024):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.total = None # bytes in the directory as last counted, kept up to date on save
+    self.evicting = True # whether save() makes room itself
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  # The key for a text, or for the bytes of a file (anything hashlib takes,
+  # such as a memoryview of a mapping); an analysis of a file's bytes counts
+  # offsets differently from one of its text, so their keys differ
+  def key(self, data):
+    if isinstance(data, type(u'')):
+      digest = hashlib.sha1(b'text:')
+      data = data.encode('utf-8', 'replace')
+    else:
+      digest = hashlib.sha1(b'bytes:')
+    digest.update(data)
+    return '%s-%d-%d' % (digest.hexdigest(), FORMAT, array('l').itemsize)
+
+  def path(self, key):
+    return os.path.join(self.directory, key + '.idx')
+
+  def load(self, key, version = None):
+    path = self.path(key)
+    try:
+      with open(path, 'rb') as handle:
+        data = zlib.decompress(handle.read())
+      os.utime(path, None)
+    except (IOError, OSError, zlib.error):
+      return None
+    try:
+      return self.decode(data, version)
+    except (ValueError, KeyError, IndexError):
+      return None
+
+  def save(self, key, analyzer):
+    data = zlib.compress(self.encode(analyzer))
+    handle, temporary = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+    try:
+      os.write(handle, data)
+    finally:
+      os.close(handle)
+    path = self.path(key)
+    try:
+      # Windows will not rename onto an existing file
+      if os.path.exists(path):
+        os.remove(path)
+      os.rename(temporary, path)
+    except OSError:
+      os.remove(temporary)
+      return
+    if self.total is not None:
+      self.total += len(data)
+    if self.evicting:
+      self.evict()
+
+  # A store on the same directory that never evicts, for worker processes
+  # to save into; the process that hands it out calls evict() once they
+  # are done, rather than each worker counting the whole directory again.
+  # What they save is not in this store's count, so it is counted afresh.
+  def for_workers(self):
+    self.total = None
+    store = IndexStore(self.directory, self.max_bytes)
+    store.evicting = False
+    return store
+
+  # The stored analysis for a key, or a new one built and stored
+  def analyzer(self, key, get_char_fn, size, version = None):
+    analyzer = self.load(key, version)
+    if analyzer is None:
+      analyzer = ScssAnalyzer(get_char_fn, size, version)
+      self.save(key, analyzer)
+    return analyzer
+
+  # An analysis patched up after edits has its offsets in ShiftedArrays
+  # and its parents worked out from the depths; both are written out plain
+  def encode(self, analyzer):
+    tokens = analyzer.tokens
+    arrays = {'kinds': tokens.kinds, 'starts': plain(tokens.starts), 'ends': plain(tokens.ends),
+              'comment_starts': plain(tokens.comments.starts),
+              'comment_ends': plain(tokens.comments.ends),
+              'opens': plain(analyzer.opens), 'closes': plain(analyzer.closes),
+              'parents': array('l', analyzer.parents), 'depths': array('B', analyzer.depths),
+              'open_tokens': plain(analyzer.open_tokens)}
+    header = {
+      'format': FORMAT,
+      'size': analyzer.size,
+      'lengths': [len(arrays[name]) for name, typecode in ARRAYS],
+      'scopes': [[scope.start, scope.end, scope.text] for scope in analyzer.scopes],
+    }
+    body = b''.join(to_bytes(arrays[name]) for name, typecode in ARRAYS)
+    return json.dumps(header).encode('utf-8') + b'\n' + body
+
+  def decode(self, data, version):
+    newline = data.index(b'\n')
+    header = json.loads(data[:newline].decode('utf-8'))
+    if header['format'] != FORMAT:
+      raise ValueError('index format %r' % header['format'])
+    arrays = {}
+    offset = newline + 1
+    for (name, typecode), length in zip(ARRAYS, header['lengths']):
+      end = offset + length * array(typecode).itemsize
+      arrays[name] = from_bytes(typecode, data[offset:end])
+      offset = end
+    if offset != len(data):
+      raise ValueError('index truncated')
+
+    tokens = TokenStream(header['size'])
+    tokens.kinds = arrays['kinds']
+    tokens.starts = arrays['starts']
+    tokens.ends = arrays['ends']
+    tokens.comments.starts = arrays['comment_starts']
+    tokens.comments.ends = arrays['comment_ends']
+    scopes = [ScopeNode(start, end, text) for start, end, text in header['scopes']]
+    if len(scopes) != len(arrays['opens']):
+      raise ValueError('index has %d scopes for %d blocks' % (len(scopes), len(arrays['opens'])))
+    return AssembledAnalyzer(header['size'], version, tokens, arrays['opens'], arrays['closes'],
+                             arrays['parents'], bytearray(to_bytes(arrays['depths'])),
+                             arrays['open_tokens'], scopes)
+
+  def entries(self):
+    for name in os.listdir(self.directory):
+      if name.endswith('.idx'):
+        path = os.path.join(self.directory, name)
+        try:
+          yield os.path.getmtime(path), os.path.getsize(path), path
+        except OSError:
+          pass
+
+  def evict(self):
+    if self.total is not None and self.total <= self.max_bytes:
+      return
+    entries = sorted(self.entries())
+    self.total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in entries:
+      if self.total <= self.max_bytes:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      self.total -= size
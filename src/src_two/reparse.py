@@ -0,0 +1,131 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from buffer_provider import BufferProvider, StringBuffer
+from scss_lexer import ScssLexer, TokenStream, OPEN, CLOSE
+from scss_analyzer import AssembledAnalyzer, MAX_DEPTH
+from scope_node import ScopeNode
+from shifted_array import ShiftedScopes, shifted
+
+# How many enclosing blocks to try before giving up on an edit
+MAX_ATTEMPTS = 3
+
+# Brings an analysis up to date with one edit that replaced the old text
+# from start up to old_end with new text ending at new_end. Only the
+# inside of the innermost block around the edit is lexed again; tokens,
+# comments and blocks after it are moved along by the change in length.
+# That move is left pending in ShiftedArrays and the parents of the
+# blocks come from their depths, so nothing after the block is rewritten
+# one by one; the arrays are only copied, which leaves the old analysis
+# as it was.
+# get_char_fn and size describe the text after the edit. Returns None
+# when the edit cannot be confined to a block, for instance when it
+# unbalances the braces or opens a comment that runs on past the block,
+# or when it is at the top level; the text then needs a full analysis.
+def reparse(analyzer, start, old_end, new_end, get_char_fn, size, version = None):
+  # past MAX_DEPTH the depths no longer give the parents
+  if MAX_DEPTH in analyzer.depths:
+    return None
+  opens = analyzer.opens
+  closes = analyzer.closes
+  # the last block opening before the edit, or one of its ancestors, is
+  # the innermost one whose braces are both untouched
+  block = bisect_left(opens, start) - 1
+  while block >= 0 and (closes[block] < old_end or closes[block] >= analyzer.size):
+    block = analyzer.parents[block]
+
+  # an unclosed block runs to the end of the text, so neither it nor its
+  # ancestors can take the edit on their own
+  attempts = 0
+  while block >= 0 and closes[block] < analyzer.size and attempts < MAX_ATTEMPTS:
+    result = splice(analyzer, block, new_end - old_end, get_char_fn, size, version)
+    if result is not None:
+      return result
+    block = analyzer.parents[block]
+    attempts += 1
+  return None
+
+def read(get_char_fn, start, end):
+  provider = getattr(get_char_fn, '__self__', None)
+  if isinstance(provider, BufferProvider):
+    return provider.substr(start, end)
+  return ''.join(get_char_fn(pos) for pos in range(start, end))
+
+def shift(values, delta):
+  return array(values.typecode, map(delta.__add__, values))
+
+# Whether the tokens of a block's inside can stand on their own: every
+# brace matched within them and nothing left open at the end
+def self_contained(tokens, length):
+  depth = 0
+  for kind in tokens.kinds:
+    if kind == OPEN:
+      depth += 1
+    elif kind == CLOSE:
+      depth -= 1
+      if depth < 0:
+        return False
+  return depth == 0 and not (len(tokens) and tokens.ends[-1] >= length)
+
+def splice(analyzer, block, delta, get_char_fn, size, version):
+  old = analyzer.tokens
+  low = analyzer.opens[block] + 1
+  old_high = analyzer.closes[block]
+  text = read(get_char_fn, low, old_high + delta)
+  inside = ScssLexer(StringBuffer(text).char_at, len(text)).tokenize()
+  if not self_contained(inside, len(text)):
+    return None
+
+  # tokens: those up to the block's {, the new inside, and the rest from its }
+  open_token = analyzer.open_tokens[block]
+  close_token = old.index_before(old_high)
+  token_delta = len(inside) - (close_token - open_token - 1)
+  tokens = TokenStream(size)
+  tokens.kinds = old.kinds[:open_token + 1] + inside.kinds + old.kinds[close_token:]
+  tokens.starts = shifted(old.starts).replace(open_token + 1, close_token, shift(inside.starts, low), delta)
+  tokens.ends = shifted(old.ends).replace(open_token + 1, close_token, shift(inside.ends, low), delta)
+
+  comments = old.comments
+  first_comment = bisect_left(comments.starts, low)
+  after_comment = bisect_left(comments.starts, old_high)
+  tokens.comments.starts = shifted(comments.starts).replace(first_comment, after_comment,
+                                                            shift(inside.comments.starts, low), delta)
+  tokens.comments.ends = shifted(comments.ends).replace(first_comment, after_comment,
+                                                        shift(inside.comments.ends, low), delta)
+
+  # blocks: the block and those before it keep their numbers, those
+  # inside are built again and those after are moved along
+  after = bisect_right(analyzer.opens, old_high)
+  opens = array('l')
+  closes = array('l')
+  depths = bytearray()
+  open_tokens = array('l')
+  scopes = []
+  stack = []
+  depth = analyzer.depths[block] + 1
+  for index in range(len(inside)):
+    kind = inside.kinds[index]
+    if kind == OPEN:
+      if depth + len(stack) >= MAX_DEPTH:
+        return None
+      stack.append(len(opens))
+      opens.append(inside.starts[index] + low)
+      closes.append(size)
+      depths.append(depth + len(stack) - 1)
+      open_tokens.append(index + open_token + 1)
+      start, statement = inside.selectors[index]
+      scopes.append(ScopeNode(start + low, inside.starts[index] + low - 1, statement.strip()))
+    elif kind == CLOSE:
+      closes[stack.pop()] = inside.starts[index] + low
+
+  opens = shifted(analyzer.opens).replace(block + 1, after, opens, delta)
+  closes = shifted(analyzer.closes).replace(block + 1, after, closes, delta)
+  # the block and those around it now close delta further on
+  ancestor = block
+  while ancestor >= 0:
+    closes.add(ancestor, delta)
+    ancestor = analyzer.parents[ancestor]
+  depths = analyzer.depths[:block + 1] + depths + analyzer.depths[after:]
+  open_tokens = shifted(analyzer.open_tokens).replace(block + 1, after, open_tokens, token_delta)
+  scopes = shifted(analyzer.scopes, ShiftedScopes).replace(block + 1, after, scopes, delta)
+
+  return AssembledAnalyzer(size, version, tokens, opens, closes, None, depths, open_tokens, scopes)
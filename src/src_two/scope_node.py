@@ -0,0 +1,92 @@
+import re
+
+# Scope kinds
+RULE = 'rule'
+DIRECTIVE = 'directive'
+CONTROL = 'control'
+AT_ROOT = 'at-root'
+
+CONTROL_RE = re.compile(r'@(for|each|while|if|else)')
+DIRECTIVE_RE = re.compile(r'@([\w-]+)')
+# Group 1: with/without
+# Group 2: space-separated list of with/without directives
+AT_ROOT_RE = re.compile(r'@at-root\s*(?:\((with|without)\s*:\s*((?:\w+\s?)+)\))?\s*')
+
+# The selector of one block, classified once when the block is found.
+# start and end span the raw statement in front of the block's {, text is
+# that statement stripped, and parts is what the selector contributes to
+# the expansion: its comma-separated alternatives, or the whole text for
+# a directive. For @at-root, exclusion and directives hold its arguments
+# and parts come from whatever follows it.
+class ScopeNode(object):
+  __slots__ = ('start', 'end', 'text', 'kind', 'name', 'exclusion', 'directives', 'parts')
+
+  def __init__(self, start, end, text):
+    self.start = start
+    self.end = end
+    self.text = text
+    self.name = None
+    self.exclusion = None
+    self.directives = ()
+
+    at_root_match = AT_ROOT_RE.search(text)
+    if at_root_match:
+      self.kind = AT_ROOT
+      self.exclusion = at_root_match.group(1)
+      if at_root_match.group(2):
+        self.directives = tuple(at_root_match.group(2).split())
+      self.parts = self.split(AT_ROOT_RE.sub('', text))
+      return
+
+    if CONTROL_RE.search(text):
+      self.kind = CONTROL
+    elif text.startswith('@'):
+      self.kind = DIRECTIVE
+    else:
+      self.kind = RULE
+    directive_match = DIRECTIVE_RE.match(text)
+    if directive_match:
+      self.name = directive_match.group(1)
+    self.parts = self.split(text)
+
+  def split(self, selector):
+    if '@' in selector:
+      return [selector]
+    return selector.split(',')
+
+  def is_directive(self):
+    return self.kind == DIRECTIVE or self.kind == CONTROL
+
+  # Whether the block compiles to a rule of its own; nested properties
+  # such as font: { ... } and bare @at-root blocks do not
+  def is_rule(self):
+    if self.kind == AT_ROOT:
+      return self.parts != ['']
+    return self.kind == RULE and self.text != '' and not self.text.endswith(':')
+
+  # A copy of the node for the same selector moved by delta characters
+  def shifted(self, delta):
+    node = ScopeNode.__new__(ScopeNode)
+    node.start = self.start + delta
+    node.end = self.end + delta
+    node.text = self.text
+    node.kind = self.kind
+    node.name = self.name
+    node.exclusion = self.exclusion
+    node.directives = self.directives
+    node.parts = self.parts
+    return node
+
+  def __repr__(self):
+    return 'ScopeNode(%d, %d, %r, %s)' % (self.start, self.end, self.text, self.kind)
+
+# A rule standing in for the context a whole text is nested in, made from
+# already expanded selectors
+def context_node(selectors):
+  node = ScopeNode(-1, -1, ', '.join(selectors))
+  node.kind = RULE
+  node.name = None
+  node.exclusion = None
+  node.directives = ()
+  node.parts = list(selectors)
+  return node
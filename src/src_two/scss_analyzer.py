@@ -0,0 +1,159 @@
+from array import array
+from bisect import bisect_right
+from itertools import count
+from scss_lexer import ScssLexer, OPEN, CLOSE, TEXT
+from scope_node import ScopeNode
+
+# Depths are kept a byte each; deeper blocks are all stored as MAX_DEPTH
+MAX_DEPTH = 255
+
+# The nesting structure of a whole text, built once and then queried at
+# any number of offsets. Blocks are numbered in the order their { appears
+# and stored column-wise: where the block opens and closes, the block it
+# is nested in (-1 at the top level), how many blocks it is nested in,
+# the token of its { and its selector as a classified ScopeNode. A block
+# that is never closed closes at the end of the text. A block contains
+# every offset from its { to its } inclusive.
+# The version tells analyses of different texts, or of different states
+# of one buffer, apart; each analysis gets a fresh one unless told otherwise.
+# is_cancelled is handed to the lexer, which gives up with BuildCancelled
+# once it returns true.
+class ScssAnalyzer():
+  versions = count()
+
+  def __init__(self, get_char_fn, size, version = None, is_cancelled = None):
+    self.size = size
+    self.version = version if version is not None else ('auto', next(ScssAnalyzer.versions))
+    self.tokens = ScssLexer(get_char_fn, size, is_cancelled).tokenize()
+    self.comments = self.tokens.comments
+    self.opens = array('l')
+    self.closes = array('l')
+    self.parents = array('l')
+    self.depths = bytearray()
+    self.open_tokens = array('l')
+    self.scopes = []
+    self.build()
+
+  def build(self):
+    tokens = self.tokens
+    stack = []
+    for index in range(len(tokens)):
+      kind = tokens.kinds[index]
+      if kind == OPEN:
+        block = len(self.opens)
+        self.opens.append(tokens.starts[index])
+        self.closes.append(self.size)
+        self.parents.append(stack[-1] if stack else -1)
+        self.depths.append(min(len(stack), MAX_DEPTH))
+        self.open_tokens.append(index)
+        start, text = tokens.selectors[index]
+        self.scopes.append(ScopeNode(start, tokens.starts[index] - 1, text.strip()))
+        stack.append(block)
+      elif kind == CLOSE and stack:
+        # a stray } at the top level closes nothing
+        self.closes[stack.pop()] = tokens.starts[index]
+
+  # The cursor may sit inside a comment, string or interpolation; its
+  # nesting is then that of the token's first character
+  def resolve(self, pos):
+    tokens = self.tokens
+    index = tokens.index_before(pos)
+    if index >= 0:
+      kind = tokens.kinds[index]
+      if kind != TEXT and kind != OPEN and kind != CLOSE and tokens.ends[index] >= pos:
+        return tokens.starts[index]
+    return pos
+
+  # Index of the innermost block containing pos, -1 if there is none.
+  # The last block opened at or before pos either contains it or is
+  # nested inside a block that does, so only its ancestors are visited.
+  def block_at(self, pos):
+    pos = self.resolve(pos)
+    block = bisect_right(self.opens, pos) - 1
+    while block >= 0 and self.closes[block] < pos:
+      block = self.parents[block]
+    return block
+
+  # Indices of every block containing pos, outermost first
+  def enclosing(self, pos):
+    chain = []
+    block = self.block_at(pos)
+    while block >= 0:
+      chain.append(block)
+      block = self.parents[block]
+    return chain[::-1]
+
+  # Every block in document order, along with the chain of blocks from
+  # the outermost one enclosing it down to the block itself
+  def walk(self):
+    opens = self.opens
+    closes = self.closes
+    stack = []
+    for block in range(len(opens)):
+      while stack and closes[stack[-1]] < opens[block]:
+        stack.pop()
+      stack.append(block)
+      yield block, list(stack)
+
+  # The enclosing blocks of many offsets at once, in the order given.
+  # Offsets are visited in ascending order with one sweep over the blocks,
+  # keeping the stack of blocks open at the current offset as it goes.
+  def enclosing_many(self, positions):
+    opens = self.opens
+    closes = self.closes
+    chains = [None] * len(positions)
+    order = sorted((self.resolve(pos), number) for number, pos in enumerate(positions))
+    stack = []
+    block = 0
+    for pos, number in order:
+      while block < len(opens) and opens[block] <= pos:
+        while stack and closes[stack[-1]] < opens[block]:
+          stack.pop()
+        stack.append(block)
+        block += 1
+      while stack and closes[stack[-1]] < pos:
+        stack.pop()
+      chains[number] = list(stack)
+    return chains
+
+  def __len__(self):
+    return len(self.opens)
+
+# The parent of each block worked out from the depths alone: the last
+# block before it that is one level further out, which a search of the
+# depths finds without a Python loop. Unlike an array of parents, it needs
+# nothing renumbered when blocks are added or removed earlier on. Blocks
+# at MAX_DEPTH or deeper are not told apart, so analyses with any keep an
+# array of parents.
+class BlockParents():
+  def __init__(self, depths):
+    self.depths = depths
+
+  def __getitem__(self, block):
+    depth = self.depths[block]
+    if depth == 0:
+      return -1
+    return self.depths.rfind(bytearray((depth - 1,)), 0, block)
+
+  def __len__(self):
+    return len(self.depths)
+
+  def __iter__(self):
+    for block in range(len(self.depths)):
+      yield self[block]
+
+# An analysis put together from parts worked out elsewhere, such as one
+# read back from disk or patched up after an edit, without lexing
+# anything. Without parents, they come from the depths.
+class AssembledAnalyzer(ScssAnalyzer):
+  def __init__(self, size, version, tokens, opens, closes, parents, depths, open_tokens, scopes):
+    self.size = size
+    self.version = version if version is not None else ('auto', next(ScssAnalyzer.versions))
+    self.tokens = tokens
+    self.comments = tokens.comments
+    self.opens = opens
+    self.closes = closes
+    self.parents = parents if parents is not None else BlockParents(depths)
+    self.depths = depths
+    self.open_tokens = open_tokens
+    self.scopes = scopes
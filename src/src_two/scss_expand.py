@@ -1,228 +1,402 @@
 import re
+from comment_index import CommentIndex
+from scss_analyzer import ScssAnalyzer
+from expansion_cache import ExpansionCache
+from scope_node import AT_ROOT, CONTROL, context_node
+from expand_stats import no_phase
+from buffer_provider import BufferProvider, CountedBuffer
+
+# Every digit with a multiple of three digits after it, to put commas
+# after; '{0:,}' does the same but needs Python 2.7
+THOUSANDS_RE = re.compile(r'(\d)(?=(\d{3})+$)')
+
+def group_digits(number):
+  return THOUSANDS_RE.sub(r'\1,', str(number))
 
 class SCSSExpand():
-  def __init__(self, startpos, get_char_fn, separator = ' '):
-    self.selectors = []
-    self.comment_blocks = [] #array of tuples /*123*/ - will give (0, 6) - inclusive!
+  max_cached_selectors = 1024
+  # How many combinations past max_selectors are gone through to count
+  # the distinct selectors left out
+  max_counted_selectors = 16384
+
+  def __init__(self, startpos, get_char_fn, separator = ' ', analyzer = None, max_selectors = None,
+               cache = None, stats = None, context = None, extends = None):
+    self.scopes = [] # ScopeNodes of the enclosing blocks, outermost first
+    self.selectors = [] # the expanded selectors
+    # Expansions of enclosing blocks remembered between queries; only
+    # useful together with an analyzer that outlives this expander
+    self.cache = cache
+    self.max_selectors = max_selectors
+    # Selectors the whole text is nested in, such as the rules a partial
+    # is imported inside elsewhere; they go in front of every rule
+    self.context = context_node(context) if context else None
+    self.context_key = tuple(context) if context else ()
+    # An ExtendIndex, whose extensions of each rule follow its own selectors
+    self.extends = extends
+    self.expanded_count = 0
+    self.omitted_count = 0
+    self.comment_blocks = CommentIndex() # /*123*/ - will give (0, 6) - inclusive!
+    # An analyzer built ahead of time (for instance once per buffer
+    # change) lets us skip rescanning from offset 0 on every query
+    self.analyzer = analyzer
+    if analyzer is not None:
+      self.comment_blocks = analyzer.comments
     self.separator = separator
+    # An ExpandStats to record phase timings, character reads and fan-out
+    # into; nothing is measured without one
+    self.stats = stats
+    if stats is not None:
+      get_char_fn = self.counted(get_char_fn)
     self.get_char_fn = get_char_fn
     self.startpos = startpos
 
   def coalesce_rule(self):
-    self.comment_machine(self.startpos)
-    if self.check_block_comment(self.startpos):
-      self.startpos = self.skip_comment(self.startpos)
+    self.count_queries(1)
+    if self.analyzer is None:
+      # the character under the cursor counts, so read up to and including it
+      self.analyze(self.startpos + 1)
+    self.count_lookups(1)
+    if self.cache is not None:
+      rule = self.cached_rule(self.analyzer.block_at(self.startpos))
+      if rule is not None:
+        return rule
     self.selector_machine(self.startpos)
-    self.process_at_root()
-
-    selector_array = filter(lambda x : not re.search('@(for|each|while|if|else)', x), self.selectors)
-    selector_array = map(self.process_selector, selector_array)
+    return self.expand_selectors()
+
+  # Expands the rules at many positions against one analysis of the text;
+  # the results come back in the order of the positions
+  def coalesce_rules(self, positions):
+    if not positions:
+      return []
+    self.count_queries(len(positions))
+    if self.analyzer is None:
+      self.analyze(max(positions) + 1)
+    self.count_lookups(len(positions))
+    results = []
+    for chain in self.analyzer.enclosing_many(positions):
+      rule = None
+      if self.cache is not None:
+        rule = self.cached_rule(chain[-1] if chain else -1)
+      if rule is None:
+        self.gather_chain(chain)
+        rule = self.expand_selectors()
+      results.append(rule)
+    return results
+
+  # Yields (block_start, block_end, selectors) for every rule in the text,
+  # in document order, from a single analysis of the text up to endpos.
+  # Blocks that are not rules (directives, loops, nested properties)
+  # are skipped, though rules nested inside them are not. Without an
+  # analyzer, endpos has to be given, as get_char_fn cannot tell where
+  # the text ends.
+  def expand_all(self, endpos = None):
+    if self.analyzer is None:
+      if endpos is None:
+        raise ValueError('expand_all needs an endpos or an analyzer')
+      self.analyze(endpos)
+    analyzer = self.analyzer
+    # each block's expansion is built on its parent's, which the walk has
+    # just produced, so even an uncached run keeps a cache of its own
+    cache = self.cache if self.cache is not None else ExpansionCache()
+    for block, chain in analyzer.walk():
+      if not analyzer.scopes[block].is_rule():
+        continue
+      self.count_queries(1)
+      with self.phase('expand_block'):
+        expanded = self.expand_block(block, cache)
+      if expanded is None:
+        self.gather_chain(chain)
+        self.expand_selectors()
+      else:
+        self.use_expanded(expanded)
+      yield (analyzer.opens[block], analyzer.closes[block],
+             [self.strip_whitespace(selector) for selector in self.selectors])
+
+  # Turns the gathered scopes, outermost first, into the final rule
+  def expand_selectors(self):
+    with self.phase('process_at_root'):
+      self.process_at_root()
+
+    selector_array = [x for x in self.scopes if x.kind != CONTROL]
+    selector_array = list(map(self.process_selector, selector_array))
 
     ### Past this point are mostly differences in formatting
     # If loop directive information must be retained,
     # modify the filter above
-    self.generate_expanded(selector_array)
-    return self.strip_whitespace((',' + self.separator).join(self.selectors))
-
-  # We read forwards for comment blocks
+    with self.phase('generate_expanded'):
+      self.generate_expanded(selector_array)
+    return self.format_rule()
+
+  def format_rule(self):
+    rule = self.strip_whitespace((',' + self.separator).join(self.selectors))
+    if self.omitted_count:
+      rule += self.separator + '...and up to %s more' % group_digits(self.omitted_count)
+    return rule
+
+  # The rule for the innermost block at a position, built from cached
+  # expansions; None when the expansion is too large to cache
+  def cached_rule(self, block):
+    if block < 0:
+      self.use_expanded(self.unique(self.context.parts) if self.context is not None else [])
+      return self.format_rule()
+    with self.phase('expand_block'):
+      expanded = self.expand_block(block, self.cache)
+    if expanded is None:
+      return None
+    self.use_expanded(expanded)
+    return self.format_rule()
+
+  def use_expanded(self, expanded):
+    self.expanded_count = len(expanded)
+    if self.max_selectors is not None:
+      self.selectors = expanded[:self.max_selectors]
+    else:
+      self.selectors = list(expanded)
+    self.omitted_count = self.expanded_count - len(self.selectors)
+    self.add_extensions()
+    self.count_expansion()
+
+  # The expanded, de-duplicated selectors of a block, computed from the
+  # expansion of its parent and cached under the block's offset and the
+  # text's version. Only @at-root, which changes which ancestors count,
+  # needs the whole chain again. Returns None if the expansion has more
+  # than max_cached_selectors selectors, as nothing that large is kept.
+  def expand_block(self, block, cache):
+    analyzer = self.analyzer
+    key = (analyzer.opens[block], analyzer.version, self.separator, self.context_key)
+    expanded = cache.get(key)
+    if expanded is not None:
+      return expanded
+
+    scope = analyzer.scopes[block]
+    parent = analyzer.parents[block]
+    if scope.kind == AT_ROOT:
+      self.gather_chain(analyzer.enclosing(analyzer.opens[block]))
+      self.process_at_root()
+      selector_array = [x for x in self.scopes if x.kind != CONTROL]
+      selector_array = list(map(self.process_selector, selector_array))
+      if self.count_expanded(selector_array) > self.max_cached_selectors:
+        return None
+      expanded = self.unique(self.iter_expanded(selector_array))
+    else:
+      if parent >= 0:
+        parent_expanded = self.expand_block(parent, cache)
+      else:
+        parent_expanded = self.context.parts if self.context is not None else []
+      if parent_expanded is None:
+        return None
+      if not scope.text or scope.kind == CONTROL:
+        expanded = parent_expanded
+      elif not parent_expanded:
+        expanded = self.unique(self.process_selector(scope))
+      else:
+        following_array = self.process_selector(scope)
+        if len(parent_expanded) * len(following_array) > self.max_cached_selectors:
+          return None
+        expanded = self.unique(self.join_selector(prefix, sel)
+                               for prefix in parent_expanded for sel in following_array)
+
+    cache.put(key, expanded)
+    return expanded
+
+  def unique(self, selectors):
+    seen = set()
+    results = []
+    for selector in selectors:
+      stripped_selector = self.strip_whitespace(selector)
+      if stripped_selector and stripped_selector not in seen:
+        seen.add(stripped_selector)
+        results.append(selector)
+    return results
+
+  def join_selector(self, selector, sel):
+    stripped_selector = self.strip_whitespace(selector)
+    if '&' in sel:
+      return sel.replace('&', stripped_selector)
+    if not stripped_selector:
+      return self.strip_whitespace(sel)
+    return stripped_selector + self.separator + self.strip_whitespace(sel)
+
+  def analyze(self, endpos):
+    with self.phase('analyze'):
+      self.analyzer = ScssAnalyzer(self.get_char_fn, endpos)
+    self.comment_blocks = self.analyzer.comments
+    return self.analyzer
+
+  # Comment blocks are a by-product of the analysis
   def comment_machine(self, endpos):
-    startpos = 0
-    endpos -= 1
-    commentstart = None
-    commentend = None
-    while startpos <= endpos:
-      char = self.get_char_fn(startpos)
-
-      # Single line comments
-      if char == '/' and self.forward_lookahead(startpos) == '/':
-        commentstart = startpos
-        while char != '\n':
-          if startpos == endpos + 1:
-            self.comment_blocks.append((commentstart, endpos))
-            return
-          startpos += 1
-          char = self.get_char_fn(startpos)
-        commentend = startpos
-        self.comment_blocks.append((commentstart, commentend))
-
-      # Block comments
-      elif char == '/' and self.forward_lookahead(startpos) == '*':
-        commentstart = startpos
-        startpos += 2 # move past the opening block so that /*/ is still commented
-        char = self.get_char_fn(startpos)
-        while char != '*' or self.forward_lookahead(startpos) != '/':
-          if startpos == endpos:
-            self.comment_blocks.append((commentstart, endpos + 1))
-            return
-          startpos += 1
-          char = self.get_char_fn(startpos)
-
-        startpos += 1
-        commentend = startpos
-        self.comment_blocks.append((commentstart, commentend))
-
-      startpos += 1
-
-  def skip_comment(self, pos):
-    for commentstart, commentend in self.comment_blocks:
-      if pos == commentend:
-        return commentstart - 1
-    return pos
+    self.analyze(endpos)
 
+  # Collects the scopes of every block enclosing cursorpos, outermost first
   def selector_machine(self, cursorpos):
-    position = self.push_next_selector(cursorpos)
-    while position >= 0:
-      position = self.push_next_selector(position)
-    self.selectors = self.selectors[::-1]
-
-  def push_next_selector(self, startpos):
-    bracket_counter = 0
-
-    while bracket_counter > -1 and startpos >= 0:
-      char = self.get_char_fn(startpos)
-      if char == '/' and self.lookahead(startpos) == '*':
-        startpos = self.skip_comment(startpos)
-      elif char == '{':
-        is_comment, startpos = self.check_comment(startpos)
-        if not is_comment:
-          bracket_counter -= 1
-      elif char == '}':
-        is_comment, startpos = self.check_comment(startpos)
-        if not is_comment:
-          bracket_counter += 1
-      startpos -= 1
-
-    # handle the case of interpolation
-    if (bracket_counter < 0 and self.get_char_fn(startpos) != '#'):
-      self.gather_selector(startpos)
-
-    return startpos
-
-  def forward_lookahead(self, pos):
-    return self.get_char_fn(pos + 1)
-
-  def lookahead(self, pos):
-    return self.get_char_fn(pos - 1)
-
-  def gather_selector(self, openposition):
-    selector = ''
-    selectorposition = openposition
-    char = self.get_char_fn(selectorposition)
-
-    while char != ';' and char != '{' and selectorposition >= 0:
-      if char == '\n' or (char == '/' and self.lookahead(selectorposition) == '*'):
-        selectorposition = self.skip_comment(selectorposition)
-        char = self.get_char_fn(selectorposition)
-
-      if char == '}':
-        stringbuffer = '}'
-        selectorposition -= 1
-
-        while char != '{' and selectorposition >= 0:
-          char = self.get_char_fn(selectorposition)
-          stringbuffer += char
-          selectorposition -= 1
-
-        if char == '{' and self.get_char_fn(selectorposition) == '#':
-          selector += stringbuffer
-          char = self.get_char_fn(selectorposition)
-        else:
-          break
-
-      if selectorposition >= 0:
-        selector += char
-        selectorposition -= 1
-        char = self.get_char_fn(selectorposition)
-
-    if len(selector) > 0:
-      selector = self.strip_whitespace(selector)
-      self.selectors.append(selector[::-1])
-
-  # Returns whether the line is a comment and
-  # the number of the first character of the comment ('/')
-  # [True, 32]
-  # If it is not a commented line, return the same selectorpos
-  def check_comment(self, selectorposition):
-    return [self.check_block_comment(selectorposition), self.skip_comment(selectorposition)]
-
-  # Returns False if the startpos is not in a block comment,
-  # returns True if it is
-  def check_block_comment(self, selectorposition):
-    for commentstart, commentend in self.comment_blocks:
-      if selectorposition >= commentstart and selectorposition <= commentend:
-        return True
-    return False
+    with self.phase('selector_machine'):
+      self.gather_chain(self.analyzer.enclosing(cursorpos))
+
+  def gather_chain(self, chain):
+    self.scopes = [self.context] if self.context is not None else []
+    for block in chain:
+      self.gather_selector(block)
+
+  def gather_selector(self, block):
+    scope = self.analyzer.scopes[block]
+    if len(scope.text) > 0:
+      self.scopes.append(scope)
 
+  # Only the innermost @at-root matters. It drops the enclosing scopes its
+  # arguments exclude; an outer @at-root counts as a rule here.
   def process_at_root(self):
-    selectors = self.selectors
-    # Group 1: with/without
-    # Group 2: space-separated list of with/without directives
-    AT_ROOT_RE = re.compile(r'@at-root\s*(?:\((with|without)\s*:\s*((?:\w+\s?)+)\))?\s*')
+    scopes = self.scopes
     at_root_index = None
-    at_root = dict() # only the final at-root is important
-    for index, selector in enumerate(selectors):
-      at_root_match = re.search(AT_ROOT_RE, selector)
-      if at_root_match:
+    for index, scope in enumerate(scopes):
+      if scope.kind == AT_ROOT:
         at_root_index = index
-        at_root['exclusion'] = at_root_match.group(1)
-        if at_root_match.group(2):
-          at_root['directives'] = at_root_match.group(2).split(' ')
-        else:
-          at_root['directives'] = []
 
-    if not at_root_index:
+    if at_root_index is None:
       return
 
-    directive_re = re.compile('@(' + '|'.join(at_root['directives']) +')')
+    at_root = scopes[at_root_index]
+    exclusion = at_root.exclusion
+    directives = at_root.directives
 
     # @at-root has two special values, 'all' and 'rule'
-    if at_root['exclusion'] == 'without' and 'all' in at_root['directives']:
-      selectors[at_root_index] = re.sub(AT_ROOT_RE, '', selectors[at_root_index])
-      self.selectors = selectors[at_root_index:] #discard everything
+    if exclusion == 'without' and 'all' in directives:
+      self.scopes = scopes[at_root_index:] #discard everything
       return
-    elif at_root['exclusion'] == 'with' and 'rule' in at_root['directives']:
+    elif exclusion == 'with' and 'rule' in directives:
       # keep listed directives and all rules
-      filter_func = lambda x: re.match(directive_re, x) or not re.match('@', x)
-    elif at_root['exclusion'] == 'with':
+      filter_func = lambda x: x.name in directives or not x.is_directive()
+    elif exclusion == 'with':
       # keep only listed directives
-      filter_func = lambda x: re.match(directive_re, x)
-    elif at_root['exclusion'] == None:
+      filter_func = lambda x: x.is_directive() and x.name in directives
+    elif exclusion == None:
       # just keep directives
-      filter_func = lambda x: re.match('@', x)
-    elif at_root['exclusion'] == 'without':
+      filter_func = lambda x: x.is_directive()
+    elif exclusion == 'without':
       # keep directives but not those listed. without rule is in this case
-      filter_func = lambda x: re.match('@', x) and not re.match(directive_re, x)
+      filter_func = lambda x: x.is_directive() and x.name not in directives
 
-    allowed_directives = filter(filter_func, selectors[:at_root_index])
-    selectors[at_root_index] = re.sub(AT_ROOT_RE, '', selectors[at_root_index])
-    self.selectors = allowed_directives + selectors[at_root_index:]
+    allowed_directives = list(filter(filter_func, scopes[:at_root_index]))
+    self.scopes = allowed_directives + scopes[at_root_index:]
 
-  def process_selector(self, selector):
-    split = []
-    if '@' in selector:
-      split = [selector]
-    else:
-      split = selector.split(',')
-    return split
+  def process_selector(self, scope):
+    return scope.parts
 
   # selector array goes forward
   # generate_expanded takes an array of arrays and joins them together
   # e.g. [['.hello', '.there'], ['.one', '.two']]
   # gives ['.hello .one', '.hello .two', '.there .one', '.there .two']
+  # Duplicates are dropped, and once max_selectors selectors have been
+  # produced the rest are only counted, in omitted_count. Only distinct
+  # selectors count, as they do for cached expansions, unless there are
+  # more than max_counted_selectors combinations to go through; then the
+  # ones not gone through are counted as they are, which is why the rule
+  # says "up to".
   def generate_expanded(self, selector_array):
+    self.expanded_count = self.count_expanded(selector_array)
+    self.selectors = []
+    seen = set()
+    examined = 0
+    hidden = 0
+    for selector in self.iter_expanded(selector_array):
+      full = self.max_selectors is not None and len(self.selectors) >= self.max_selectors
+      if full and examined >= self.max_counted_selectors:
+        break
+      examined += 1
+      stripped_selector = self.strip_whitespace(selector)
+      if stripped_selector and stripped_selector not in seen:
+        seen.add(stripped_selector)
+        if full:
+          hidden += 1
+        else:
+          self.selectors.append(selector)
+    # hidden is exact once every combination has been gone through
+    self.omitted_count = hidden + self.expanded_count - examined
+    self.add_extensions()
+    self.count_expansion()
+
+  # Selectors the rule also compiles to because other rules @extend
+  # something in it; they count towards max_selectors like the rest
+  def add_extensions(self):
+    if self.extends is None:
+      return
+    extensions = self.extends.extend([self.strip_whitespace(selector) for selector in self.selectors])
+    self.expanded_count += len(extensions)
+    if self.max_selectors is not None:
+      shown = extensions[:max(self.max_selectors - len(self.selectors), 0)]
+      self.omitted_count += len(extensions) - len(shown)
+      extensions = shown
+    self.selectors = self.selectors + extensions
+
+  # The number of combinations iter_expanded goes through
+  def count_expanded(self, selector_array):
+    if not selector_array:
+      return 0
+    count = 1
+    for following_array in selector_array:
+      count *= len(following_array)
+    return count
+
+  # Lazily produces the combinations in the same order as the nested loops
+  # would, building each shared prefix only once
+  def iter_expanded(self, selector_array):
+    if not selector_array:
+      return
+    levels = [[(sel, '&' in sel, self.strip_whitespace(sel)) for sel in following_array]
+              for following_array in selector_array[1:]]
+
+    def expand(selector, depth):
+      if depth == len(levels):
+        yield selector
+        return
+      stripped_selector = self.strip_whitespace(selector)
+      for sel, has_parent, stripped_sel in levels[depth]:
+        if has_parent:
+          combined = sel.replace('&', stripped_selector)
+        elif not stripped_selector:
+          combined = stripped_sel
+        else:
+          combined = stripped_selector + self.separator + stripped_sel
+        for expanded in expand(combined, depth + 1):
+          yield expanded
 
-    def comma_reducer(array, following_array):
-      results = []
-      for selector in array:
-        for sel in following_array:
-          stripped_selector = self.strip_whitespace(selector)
-          if '&' in sel:
-            results.append(sel.replace('&', stripped_selector))
-          else:
-            results.append(stripped_selector + self.separator + self.strip_whitespace(sel))
-      return results
-
-    self.selectors = reduce(comma_reducer, selector_array)
+    for selector in selector_array[0]:
+      for expanded in expand(selector, 0):
+        yield expanded
 
   def strip_whitespace(self, selector):
     return selector.strip()
+
+  ### Instrumentation; all of it does nothing unless stats were given
+
+  def phase(self, name):
+    if self.stats is None:
+      return no_phase
+    return self.stats.phase(name)
+
+  # The reads of a provider are counted through a provider, so that the
+  # lexer scans it a window at a time just as it would without stats
+  def counted(self, get_char_fn):
+    provider = getattr(get_char_fn, '__self__', None)
+    if isinstance(provider, BufferProvider):
+      return CountedBuffer(provider, self.stats).char_at
+    stats = self.stats
+    def get_char(pos):
+      stats.char_reads += 1
+      return get_char_fn(pos)
+    return get_char
+
+  def count_queries(self, count):
+    if self.stats is not None:
+      self.stats.queries += count
+
+  # Each cursor lookup first moves the cursor out of any comment, string
+  # or interpolation it is in
+  def count_lookups(self, count):
+    if self.stats is not None:
+      self.stats.comment_lookups += count
+
+  def count_expansion(self):
+    if self.stats is not None:
+      self.stats.expanded_count += self.expanded_count
+      self.stats.selector_count += len(self.selectors)
+      self.stats.omitted_count += self.omitted_count
@@ -0,0 +1,182 @@
+import json, re, sys, traceback
+from bisect import bisect_right
+from buffer_provider import StringBuffer
+from scss_analyzer import ScssAnalyzer
+from scss_expand import SCSSExpand
+from expansion_cache import ExpansionCache
+from reparse import reparse
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+# Messages decoded from JSON hold unicode strings on Python 2, and those
+# made in Python may hold either
+STRINGS = (type(''), type(u''))
+
+class RequestError(Exception):
+  def __init__(self, code, message):
+    Exception.__init__(self, message)
+    self.code = code
+    self.message = message
+
+def offset_param(params, name):
+  value = params.get(name)
+  if not isinstance(value, int) or isinstance(value, bool):
+    raise RequestError(INVALID_PARAMS, '%s must be an offset' % name)
+  return value
+
+# One open document: its text and an analysis of it that follows every
+# change, along with the expansions of its blocks. Each change gets a new
+# revision, which the analysis carries as its version so that expansions
+# of earlier revisions are never handed out again.
+class Document():
+  def __init__(self, text, version = None):
+    self.version = version
+    self.revision = 0
+    self.cache = ExpansionCache()
+    self.replace(text)
+
+  def replace(self, text):
+    self.text = text
+    self.revision += 1
+    self.breaks = None
+    buffer = StringBuffer(text)
+    self.analyzer = ScssAnalyzer(buffer.char_at, buffer.size(), self.revision)
+
+  # Replaces the text from start up to end, relexing only the block the
+  # change falls in when it can
+  def change(self, start, end, text):
+    if not 0 <= start <= end <= len(self.text):
+      raise RequestError(INVALID_PARAMS, 'change %d-%d is outside the document' % (start, end))
+    self.text = self.text[:start] + text + self.text[end:]
+    self.revision += 1
+    self.breaks = None
+    buffer = StringBuffer(self.text)
+    analyzer = reparse(self.analyzer, start, end, start + len(text),
+                       buffer.char_at, buffer.size(), self.revision)
+    if analyzer is None:
+      analyzer = ScssAnalyzer(buffer.char_at, buffer.size(), self.revision)
+    self.analyzer = analyzer
+
+  # The line of an offset, counting from 1
+  def line(self, offset):
+    if self.breaks is None:
+      self.breaks = [match.start() for match in re.finditer('\n', self.text)]
+    return bisect_right(self.breaks, offset - 1) + 1
+
+  def expander(self, offset, separator, max_selectors):
+    buffer = StringBuffer(self.text)
+    return SCSSExpand(offset, buffer.char_at, separator, self.analyzer, max_selectors, self.cache)
+
+# Answers JSON-RPC 2.0 messages about SCSS documents the client opens,
+# edits and closes, keeping each one analysed in between. Offsets count
+# characters from the start of the document, and the optional separator
+# stands for the whitespace in a rule, as in SCSSExpand.
+#   didOpen    {uri, text, version}
+#   didChange  {uri, version, changes: [{start, end, text}]}; a change
+#              with no start or end replaces the whole text
+#   didClose   {uri}
+#   expand     {uri, offset, separator} -> {rule, selectors, omitted, version}
+#   expandAll  {uri} -> [{offset, end, line, selectors}]
+#   shutdown   {} -> null, after which the server stops
+class ExpandServer():
+  def __init__(self, max_selectors = None):
+    self.max_selectors = max_selectors
+    self.documents = {} # uri -> Document
+    self.running = True
+
+  # The response to one message, or None for a notification
+  def handle(self, message):
+    if not isinstance(message, dict) or not isinstance(message.get('method'), STRINGS):
+      return self.error(None, INVALID_REQUEST, 'not a JSON-RPC request')
+    request_id = message.get('id')
+    params = message.get('params', {})
+    method = getattr(self, 'rpc_' + message['method'], None)
+    try:
+      if method is None:
+        raise RequestError(METHOD_NOT_FOUND, 'no method %s' % message['method'])
+      if not isinstance(params, dict):
+        raise RequestError(INVALID_PARAMS, 'params must be an object')
+      result = method(params)
+    except RequestError as error:
+      return self.error(request_id, error.code, error.message) if 'id' in message else None
+    except Exception:
+      traceback.print_exc(file = sys.stderr)
+      return self.error(request_id, INTERNAL_ERROR, 'internal error') if 'id' in message else None
+    if 'id' not in message:
+      return None
+    return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+  def error(self, request_id, code, message):
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
+
+  def document(self, params):
+    document = self.documents.get(params.get('uri'))
+    if document is None:
+      raise RequestError(INVALID_PARAMS, 'document %s is not open' % params.get('uri'))
+    return document
+
+  def rpc_didOpen(self, params):
+    text = params.get('text')
+    if not isinstance(text, STRINGS) or 'uri' not in params:
+      raise RequestError(INVALID_PARAMS, 'didOpen needs a uri and a text')
+    self.documents[params['uri']] = Document(text, params.get('version'))
+
+  def rpc_didChange(self, params):
+    document = self.document(params)
+    for change in params.get('changes', ()):
+      text = change.get('text') if isinstance(change, dict) else None
+      if not isinstance(text, STRINGS):
+        raise RequestError(INVALID_PARAMS, 'a change needs a text')
+      if 'start' in change or 'end' in change:
+        document.change(offset_param(change, 'start'), offset_param(change, 'end'), text)
+      else:
+        document.replace(text)
+    document.version = params.get('version', document.version)
+
+  def rpc_didClose(self, params):
+    self.documents.pop(params.get('uri'), None)
+
+  def rpc_expand(self, params):
+    document = self.document(params)
+    expander = document.expander(offset_param(params, 'offset'), params.get('separator', ' '),
+                                 self.max_selectors)
+    rule = expander.coalesce_rule()
+    return {'rule': rule, 'omitted': expander.omitted_count, 'version': document.version,
+            'selectors': [expander.strip_whitespace(selector) for selector in expander.selectors]}
+
+  def rpc_expandAll(self, params):
+    document = self.document(params)
+    expander = document.expander(0, ' ', self.max_selectors)
+    return [{'offset': start, 'end': end, 'line': document.line(start), 'selectors': selectors}
+            for start, end, selectors in expander.expand_all()]
+
+  def rpc_shutdown(self, params):
+    self.running = False
+
+# Reads one message per line from stdin and writes each response as a
+# line of its own to out, until stdin ends or the client shuts it down
+def serve(stdin, out, max_selectors = None):
+  server = ExpandServer(max_selectors)
+  while server.running:
+    line = stdin.readline()
+    if not line:
+      break
+    if isinstance(line, bytes):
+      line = line.decode('utf-8')
+    if not line.strip():
+      continue
+    try:
+      message = json.loads(line)
+    except ValueError:
+      response = server.error(None, PARSE_ERROR, 'not valid JSON')
+    else:
+      response = server.handle(message)
+    if response is not None:
+      out.write(json.dumps(response, sort_keys = True) + '\n')
+      out.flush()
+  return 0
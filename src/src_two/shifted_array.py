@@ -0,0 +1,77 @@
+from array import array
+
+# Offsets kept for a text that is being edited. The values from index
+# step on are stored delta less than they are, so moving everything after
+# an edit along only changes delta instead of every value. replace() puts
+# the step at the end of the new values; only the values between the old
+# step and the new one are rewritten, so the cost of an edit follows the
+# length of what it replaces and how far it is from the previous edit,
+# not the length of the array. Reads go through __getitem__, which is
+# all bisect and the analyzer's queries need.
+class ShiftedArray():
+  def __init__(self, values, step = None, delta = 0):
+    self.values = values
+    self.step = len(values) if step is None else step
+    self.delta = delta
+
+  def moved(self, values, delta):
+    return array(values.typecode, [value + delta for value in values])
+
+  def __getitem__(self, index):
+    if index < 0:
+      index += len(self.values)
+    if index >= self.step:
+      return self.values[index] + self.delta
+    return self.values[index]
+
+  def __len__(self):
+    return len(self.values)
+
+  def __iter__(self):
+    return iter(self.materialize())
+
+  # A copy with the values from lo up to hi replaced by new ones, given as
+  # they are, and every value after them moved along by delta
+  def replace(self, lo, hi, new_values, delta):
+    values = self.values
+    step = self.step
+    head = values[:lo]
+    if step < lo and self.delta:
+      head[step:] = self.moved(head[step:], self.delta)
+    tail = values[hi:]
+    if hi < step and self.delta:
+      tail[:step - hi] = self.moved(tail[:step - hi], -self.delta)
+    return self.__class__(head + new_values + tail, lo + len(new_values), self.delta + delta)
+
+  # Moves the one value at index along by delta
+  def add(self, index, delta):
+    self.values[index] += delta
+
+  # The values as a plain array (or list)
+  def materialize(self):
+    return self.values[:self.step] + self.moved(self.values[self.step:], self.delta)
+
+# The ScopeNodes of an analysis the same way; a node past the step is
+# moved when it is read
+class ShiftedScopes(ShiftedArray):
+  def moved(self, nodes, delta):
+    return [node.shifted(delta) for node in nodes]
+
+  def __getitem__(self, index):
+    if index < 0:
+      index += len(self.values)
+    if index >= self.step:
+      return self.values[index].shifted(self.delta)
+    return self.values[index]
+
+# A ShiftedArray of values, starting without any delta
+def shifted(values, shifted_class = ShiftedArray):
+  if isinstance(values, ShiftedArray):
+    return values
+  return shifted_class(values)
+
+# The values of an array or ShiftedArray as a plain array
+def plain(values):
+  if isinstance(values, ShiftedArray):
+    return values.materialize()
+  return values
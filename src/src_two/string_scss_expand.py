@@ -1,7 +1,16 @@
-import scss_expand
+from scss_expand import SCSSExpand
+from buffer_provider import StringBuffer
 
-class StringSCSSExpand(scss_expand.SCSSExpand):
-  def __init__(self, startpos, text):
+class StringSCSSExpand(SCSSExpand):
+  def __init__(self, startpos, text, analyzer = None, max_selectors = None, cache = None,
+               stats = None, context = None, extends = None):
     self.text = text
-    get_char_fn = lambda index : self.text[index]
-    scss_expand.SCSSExpand.__init__(self, startpos, get_char_fn)
+    self.buffer = StringBuffer(text)
+    SCSSExpand.__init__(self, startpos, self.buffer.char_at, analyzer = analyzer,
+                        max_selectors = max_selectors, cache = cache, stats = stats,
+                        context = context, extends = extends)
+
+  def expand_all(self, endpos = None):
+    if endpos is None:
+      endpos = len(self.text)
+    return SCSSExpand.expand_all(self, endpos)
@@ -0,0 +1,130 @@
+"""Times the expander on synthetic SCSS.
+
+Run from the repository root with either Python to benchmark the engine
+for that version:
+
+  python -m test.benchmark
+  python -m test.benchmark --scenario deep --positions 200
+"""
+import gc, optparse, sys, time
+
+if sys.version < '3':
+  from src.src_two.string_scss_expand import StringSCSSExpand
+  from src.src_two.expansion_cache import ExpansionCache
+  engine = 'src_two'
+else:
+  from src.src_three.string_scss_expand import StringSCSSExpand
+  from src.src_three.expansion_cache import ExpansionCache
+  engine = 'src_three'
+
+from test.scss_corpus import ScssCorpus
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+try:
+  timer = time.perf_counter
+except AttributeError:
+  timer = time.time
+
+SCENARIOS = [
+  ('baseline', dict(size = 20000)),
+  ('large', dict(size = 200000)),
+  ('deep', dict(size = 50000, depth = 8, siblings = 1, declarations = 4)),
+  ('siblings', dict(size = 50000, depth = 2, siblings = 25)),
+  ('commented', dict(size = 50000, comment_density = 0.8)),
+  ('comma-lists', dict(size = 20000, depth = 4, comma_width = 4)),
+  ('at-root', dict(size = 50000, at_root_frequency = 0.3)),
+]
+
+def percentile(samples, fraction):
+  ordered = sorted(samples)
+  index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+  return ordered[index]
+
+def start_memory():
+  gc.collect()
+  if tracemalloc is not None:
+    tracemalloc.start()
+
+# Peak traced memory in KiB, None where there is no tracemalloc. Python 2
+# has nothing to take its place: the process's peak resident size never
+# goes down, so it would count every scenario run before this one.
+def stop_memory():
+  if tracemalloc is None:
+    return None
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return peak // 1024
+
+def describe_memory(peak):
+  return 'n/a' if peak is None else '%d KiB' % peak
+
+# Each query on its own, the way a single ctrl+e works without an index
+def time_fresh(text, positions):
+  samples = []
+  for position in positions:
+    began = timer()
+    StringSCSSExpand(position, text).coalesce_rule()
+    samples.append(timer() - began)
+  return samples
+
+# Queries against one analysis of the whole text and a shared cache
+def time_indexed(text, positions):
+  began = timer()
+  analyzer = StringSCSSExpand(0, text).analyze(len(text))
+  build = timer() - began
+  cache = ExpansionCache()
+  samples = []
+  for position in positions:
+    began = timer()
+    StringSCSSExpand(position, text, analyzer, cache = cache).coalesce_rule()
+    samples.append(timer() - began)
+  return build, samples
+
+def describe(samples):
+  milliseconds = [sample * 1000 for sample in samples]
+  return 'p50 %8.3f  p90 %8.3f  p99 %8.3f  max %8.3f ms' % (
+    percentile(milliseconds, 0.5), percentile(milliseconds, 0.9),
+    percentile(milliseconds, 0.99), max(milliseconds))
+
+def run(name, parameters, count):
+  corpus = ScssCorpus(**parameters)
+  text = corpus.generate()
+  positions = corpus.positions(text, count)
+
+  # tracing allocations slows everything down, so timings and peak
+  # memory come from separate runs
+  fresh = time_fresh(text, positions)
+  build, indexed = time_indexed(text, positions)
+
+  start_memory()
+  time_fresh(text, positions)
+  fresh_memory = stop_memory()
+
+  start_memory()
+  time_indexed(text, positions)
+  indexed_memory = stop_memory()
+
+  print('%s: %d chars, %d positions' % (name, len(text), len(positions)))
+  print('  fresh    %s  peak %s' % (describe(fresh), describe_memory(fresh_memory)))
+  print('  indexed  %s  peak %s  (build %.3f ms)' % (describe(indexed), describe_memory(indexed_memory), build * 1000))
+
+def main(argv = None):
+  parser = optparse.OptionParser(description = 'Benchmark the SCSS expander on synthetic SCSS.')
+  parser.add_option('--scenario', action = 'append', type = 'choice', choices = [name for name, _ in SCENARIOS],
+                    help = 'scenario to run; may be repeated (default: all)')
+  parser.add_option('--positions', type = 'int', default = 100,
+                    help = 'cursor positions to query per scenario (default: 100)')
+  args, _ = parser.parse_args(argv)
+
+  print('engine %s, Python %s' % (engine, sys.version.split()[0]))
+  for name, parameters in SCENARIOS:
+    if args.scenario and name not in args.scenario:
+      continue
+    run(name, parameters, args.positions)
+
+if __name__ == '__main__':
+  main()
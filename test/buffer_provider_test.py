@@ -0,0 +1,96 @@
+import unittest, sys, os, tempfile
+
+if sys.version < '3':
+  from src.src_two.buffer_provider import StringBuffer, ChunkedBuffer, MappedBuffer
+  from src.src_two.scss_expand import SCSSExpand
+else:
+  from src.src_three.buffer_provider import StringBuffer, ChunkedBuffer, MappedBuffer
+  from src.src_three.scss_expand import SCSSExpand
+
+
+class CountingBuffer(ChunkedBuffer):
+  """A chunked buffer over a string that counts how often it is read."""
+  def __init__(self, text, chunk_size):
+    ChunkedBuffer.__init__(self, chunk_size)
+    self.text = text
+    self.reads = 0
+
+  def size(self):
+    return len(self.text)
+
+  def read(self, start, end):
+    self.reads += 1
+    return self.text[start:end]
+
+
+class TestBufferProvider(unittest.TestCase):
+
+  def test_string_buffer_out_of_range(self):
+    """Reading past either end gives a null character."""
+    buffer = StringBuffer("abc")
+
+    self.assertEqual(buffer[0], "a")
+    self.assertEqual(buffer[2], "c")
+    self.assertEqual(buffer[-1], "\x00")
+    self.assertEqual(buffer[3], "\x00")
+    self.assertEqual(len(buffer), 3)
+
+  def test_chunked_char_access(self):
+    """Gives the same characters as the text it wraps, reading each window once."""
+    text = "0123456789abcdefghij"
+    buffer = CountingBuffer(text, 4)
+
+    actual = "".join(buffer.char_at(pos) for pos in reversed(range(len(text))))
+    actual += "".join(buffer.char_at(pos) for pos in range(len(text)))
+
+    self.assertEqual(actual, text[::-1] + text)
+    self.assertEqual(buffer.reads, 5)
+    self.assertEqual(buffer.char_at(20), "\x00")
+    self.assertEqual(buffer.char_at(-1), "\x00")
+
+  def test_chunked_substr(self):
+    """Joins windows when a substring straddles them."""
+    text = "0123456789abcdefghij"
+    buffer = CountingBuffer(text, 4)
+
+    self.assertEqual(buffer.substr(3, 13), text[3:13])
+    self.assertEqual(buffer.substr(-5, 2), text[0:2])
+    self.assertEqual(buffer.substr(18, 40), text[18:])
+    self.assertEqual(buffer.substr(7, 7), "")
+
+  def test_chunked_expansion(self):
+    """Expands the same rule as a plain string while reading far fewer times."""
+    string = """
+.foo, .bar {
+  /* .comment { */
+  .baz {
+    outline: none;
+  }
+}
+    """
+    buffer = CountingBuffer(string, 16)
+    sse = SCSSExpand(52, buffer.char_at)
+    actual_rule = sse.coalesce_rule()
+    expected_rule = ".foo .baz, .bar .baz"
+
+    self.assertEqual(actual_rule, expected_rule)
+    self.assertTrue(buffer.reads <= 4)
+
+  def test_mapped_buffer(self):
+    """Reads a file as bytes, one character each, and decodes shown spans as UTF-8."""
+    handle, path = tempfile.mkstemp(suffix = '.scss')
+    os.write(handle, u'.caf\u00e9 {\n  .b { x: y; }\n}\n'.encode('utf-8'))
+    os.close(handle)
+    try:
+      with MappedBuffer(path, chunk_size = 4) as buffer:
+        self.assertEqual(buffer.size(), 26)
+        self.assertEqual(buffer.char_at(7), '{')
+        self.assertEqual(buffer.char_at(26), '\x00')
+        self.assertEqual(buffer.text(0, 6), u'.caf\u00e9')
+        self.assertEqual(buffer.newlines(), [8, 23, 25])
+
+        sse = SCSSExpand(20, buffer.char_at)
+        self.assertEqual(buffer.decode(sse.coalesce_rule()), u'.caf\u00e9 .b')
+        self.assertEqual(buffer.chunks, {})
+    finally:
+      os.remove(path)
@@ -0,0 +1,107 @@
+import unittest, sys, os, json
+
+if sys.version < '3':
+  from src.src_two.cli import main, expand_text, find_files
+else:
+  from src.src_three.cli import main, expand_text, find_files
+
+from test.project_files import ProjectFiles
+
+
+class Output():
+  def __init__(self):
+    self.lines = []
+
+  def write(self, text):
+    self.lines.append(text)
+
+  def records(self):
+    return [json.loads(line) for line in ''.join(self.lines).splitlines()]
+
+
+class TestCli(ProjectFiles, unittest.TestCase):
+
+  def setUp(self):
+    ProjectFiles.setUp(self)
+    self.write('main.scss', '.a {\n  .b, .c { x: y; }\n}\n')
+    self.write('partials/_two.scss', '@media print {\n  .d { e: f; }\n}\n')
+    self.write('notes.txt', '.ignored {}')
+
+  def test_expand_text(self):
+    """Gives every rule with its offsets, line and selectors."""
+    actual_records = expand_text('x.scss', '.a {\n  .b, .c { x: y; }\n}\n')
+    expected_records = [
+      {'file': 'x.scss', 'offset': 3, 'end': 24, 'line': 1, 'selectors': ['.a']},
+      {'file': 'x.scss', 'offset': 14, 'end': 22, 'line': 2, 'selectors': ['.a .b', '.a .c']},
+    ]
+
+    self.assertEqual(actual_records, expected_records)
+
+  def test_find_files(self):
+    """Searches directories for SCSS files only, in a stable order."""
+    actual_files = list(find_files([self.directory, '-']))
+    expected_files = [os.path.join(self.directory, 'main.scss'),
+                      os.path.join(self.directory, 'partials', '_two.scss'), '-']
+
+    self.assertEqual(actual_files, expected_files)
+
+  def test_main(self):
+    """Streams the same records in file order whether or not it uses a pool."""
+    serial = Output()
+    parallel = Output()
+
+    self.assertEqual(main(['-j', '1', self.directory], serial), 0)
+    self.assertEqual(main(['-j', '2', self.directory], parallel), 0)
+    self.assertEqual(serial.records(), parallel.records())
+    self.assertEqual([record['selectors'] for record in serial.records()],
+                     [['.a'], ['.a .b', '.a .c'], ['@media print .d']])
+
+  def test_mapped(self):
+    """Gives the same records for mapped files, with offsets in bytes."""
+    self.write('utf.scss', u'/* \u2603 */ .a { .b {} }')
+    path = os.path.join(self.directory, 'utf.scss')
+    read = Output()
+    mapped = Output()
+
+    self.assertEqual(main([path], read), 0)
+    self.assertEqual(main(['--mmap', path], mapped), 0)
+    self.assertEqual([record['selectors'] for record in mapped.records()],
+                     [record['selectors'] for record in read.records()])
+    self.assertEqual([record['offset'] - 2 for record in mapped.records()],
+                     [record['offset'] for record in read.records()])
+
+  def test_find(self):
+    """Lists only the rules that compile to the selectors asked for."""
+    output = Output()
+
+    self.assertEqual(main(['--find', '.a  .c', '--find', '.d', self.directory], output), 0)
+    self.assertEqual([(record['line'], record['selectors']) for record in output.records()],
+                     [(2, ['.a .c'])])
+
+  def test_duplicates(self):
+    """Lists the selectors compiled from more than one rule and fails."""
+    self.write('partials/_three.scss', '.a .c { z: w; }\n.a {\n  > .b { v: u; }\n}\n')
+    output = Output()
+    main_path = os.path.join(self.directory, 'main.scss')
+    three_path = os.path.join(self.directory, 'partials', '_three.scss')
+
+    self.assertEqual(main(['-j', '2', '--duplicates', self.directory], output), 1)
+    self.assertEqual(output.records(), [
+      {'selector': '.a', 'locations': [{'file': main_path, 'offset': 3, 'line': 1},
+                                       {'file': three_path, 'offset': 19, 'line': 2}]},
+      {'selector': '.a .c', 'locations': [{'file': main_path, 'offset': 14, 'line': 2},
+                                          {'file': three_path, 'offset': 6, 'line': 1}]},
+    ])
+
+    unique = Output()
+    self.assertEqual(main(['--duplicates', '--find', '.a > .b', self.directory], unique), 0)
+    self.assertEqual(unique.records(), [])
+
+  def test_unreadable_file(self):
+    """Reports a file it cannot read and fails."""
+    output = Output()
+    missing = os.path.join(self.directory, 'missing.scss')
+
+    self.assertEqual(main([missing], output), 1)
+    self.assertEqual(output.records()[0]['file'], missing)
+    self.assertTrue('error' in output.records()[0])
@@ -0,0 +1,52 @@
+import unittest, sys
+
+if sys.version < '3':
+  from src.src_two.comment_index import CommentIndex
+else:
+  from src.src_three.comment_index import CommentIndex
+
+
+class TestCommentIndex(unittest.TestCase):
+
+  def test_containing(self):
+    """Finds the comment an offset falls into, ends inclusive."""
+    index = CommentIndex([(2, 5), (10, 10), (20, 31)])
+
+    self.assertEqual(index.containing(1), None)
+    self.assertEqual(index.containing(2), 2)
+    self.assertEqual(index.containing(5), 2)
+    self.assertEqual(index.containing(6), None)
+    self.assertEqual(index.containing(10), 10)
+    self.assertEqual(index.containing(25), 20)
+    self.assertEqual(index.containing(32), None)
+
+  def test_ending_at(self):
+    """Finds a comment only by its last character."""
+    index = CommentIndex([(2, 5), (20, 31)])
+
+    self.assertEqual(index.ending_at(5), 2)
+    self.assertEqual(index.ending_at(31), 20)
+    self.assertEqual(index.ending_at(4), None)
+    self.assertEqual(index.ending_at(40), None)
+
+  def test_empty(self):
+    """An empty index contains nothing."""
+    index = CommentIndex()
+
+    self.assertEqual(len(index), 0)
+    self.assertEqual(index.containing(0), None)
+    self.assertEqual(index.ending_at(0), None)
+
+  def test_rejects_out_of_order(self):
+    """Comments must be added in document order without overlapping."""
+    index = CommentIndex([(10, 20)])
+
+    self.assertRaises(ValueError, index.add, 15, 30)
+    self.assertRaises(ValueError, index.add, 0, 5)
+
+  def test_iterates_as_tuples(self):
+    """Iterates as (start, end) tuples."""
+    index = CommentIndex([(0, 9), (12, 14)])
+
+    self.assertEqual(list(index), [(0, 9), (12, 14)])
+    self.assertEqual(index[1], (12, 14))
@@ -0,0 +1,73 @@
+import unittest, sys
+
+if sys.version < '3':
+  from src.src_two.string_scss_expand import StringSCSSExpand
+  from src.src_two.expand_stats import ExpandStats
+  from src.src_two.expansion_cache import ExpansionCache
+  from src.src_two.buffer_provider import BufferProvider
+else:
+  from src.src_three.string_scss_expand import StringSCSSExpand
+  from src.src_three.expand_stats import ExpandStats
+  from src.src_three.expansion_cache import ExpansionCache
+  from src.src_three.buffer_provider import BufferProvider
+
+
+class TestExpandStats(unittest.TestCase):
+
+  text = ".a, .b { /* c */ .c, .d { color: red; } }"
+
+  def test_records_phases(self):
+    """Times each phase of a fresh expansion and counts what it read."""
+    stats = ExpandStats()
+    rule = StringSCSSExpand(30, self.text, stats = stats).coalesce_rule()
+
+    self.assertEqual(rule, ".a .c, .a .d, .b .c, .b .d")
+    self.assertEqual(sorted(stats.phases),
+                     ["analyze", "generate_expanded", "process_at_root", "selector_machine"])
+    self.assertEqual(stats.calls["analyze"], 1)
+    self.assertEqual(stats.queries, 1)
+    self.assertEqual(stats.char_reads, 31)
+    self.assertEqual(stats.comment_lookups, 1)
+    self.assertEqual((stats.expanded_count, stats.selector_count, stats.omitted_count), (4, 4, 0))
+
+  def test_same_scan_as_without_stats(self):
+    """Counts the reads of a buffer without losing its windowed scan."""
+    stats = ExpandStats()
+    expander = StringSCSSExpand(30, self.text, stats = stats)
+    expander.coalesce_rule()
+    plain = StringSCSSExpand(30, self.text)
+    plain.coalesce_rule()
+
+    self.assertTrue(isinstance(expander.get_char_fn.__self__, BufferProvider))
+    self.assertEqual(list(expander.analyzer.tokens.starts), list(plain.analyzer.tokens.starts))
+    self.assertEqual(stats.char_reads, 31)
+
+  def test_indexed_queries_read_nothing(self):
+    """Queries against a prebuilt analyzer never touch the text."""
+    analyzer = StringSCSSExpand(0, self.text).analyze(len(self.text))
+    stats = ExpandStats()
+    StringSCSSExpand(0, self.text, analyzer, cache = ExpansionCache(), stats = stats).coalesce_rules([30, 10])
+
+    self.assertEqual(stats.char_reads, 0)
+    self.assertEqual(stats.queries, 2)
+    self.assertEqual(stats.comment_lookups, 2)
+    self.assertEqual(stats.calls["expand_block"], 2)
+    self.assertFalse("analyze" in stats.phases)
+    self.assertEqual(stats.expanded_count, 6)
+
+  def test_cache_miss_looks_up_once(self):
+    """Counts one lookup for a query the cache has not seen."""
+    stats = ExpandStats()
+    StringSCSSExpand(30, self.text, cache = ExpansionCache(), stats = stats).coalesce_rule()
+
+    self.assertEqual(stats.queries, 1)
+    self.assertEqual(stats.comment_lookups, 1)
+
+  def test_fan_out_counts_omitted(self):
+    """Counts the combinations a capped expansion leaves out."""
+    stats = ExpandStats()
+    StringSCSSExpand(30, self.text, max_selectors = 1, stats = stats).coalesce_rule()
+
+    self.assertEqual((stats.expanded_count, stats.selector_count, stats.omitted_count), (4, 1, 3))
+    self.assertTrue("1/4 selectors" in stats.summary())
+    self.assertTrue("3 left out" in str(stats))
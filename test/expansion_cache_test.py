@@ -0,0 +1,46 @@
+import unittest, sys
+
+if sys.version < '3':
+  from src.src_two.expansion_cache import ExpansionCache
+else:
+  from src.src_three.expansion_cache import ExpansionCache
+
+
+class TestExpansionCache(unittest.TestCase):
+
+  def test_get_and_put(self):
+    """Returns what was put and None for anything else."""
+    cache = ExpansionCache()
+    cache.put(("a", 1), [".a"])
+
+    self.assertEqual(cache.get(("a", 1)), [".a"])
+    self.assertEqual(cache.get(("a", 2)), None)
+    self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+  def test_evicts_least_recently_used(self):
+    """Drops the entry used longest ago once over capacity."""
+    cache = ExpansionCache(capacity = 2)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    cache.get("a")
+    cache.put("c", [3])
+
+    self.assertEqual(len(cache), 2)
+    self.assertTrue("a" in cache)
+    self.assertFalse("b" in cache)
+    self.assertTrue("c" in cache)
+
+  def test_replace_and_clear(self):
+    """Keeps one entry per key, freshly used when replaced, until cleared."""
+    cache = ExpansionCache(capacity = 2)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    cache.put("a", [3])
+    cache.put("c", [4])
+
+    self.assertEqual(cache.get("a"), [3])
+    self.assertFalse("b" in cache)
+    cache.clear()
+    self.assertEqual(len(cache), 0)
+    cache.put("d", [5])
+    self.assertEqual(cache.get("d"), [5])
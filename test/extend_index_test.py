@@ -0,0 +1,55 @@
+import unittest, sys
+
+if sys.version < '3':
+  from src.src_two.extend_index import ExtendIndex
+  from src.src_two.string_scss_expand import StringSCSSExpand
+else:
+  from src.src_three.extend_index import ExtendIndex
+  from src.src_three.string_scss_expand import StringSCSSExpand
+
+from test.project_files import ProjectFiles
+
+
+class TestExtendIndex(ProjectFiles, unittest.TestCase):
+
+  def setUp(self):
+    ProjectFiles.setUp(self)
+    self.write('buttons.scss', """
+%button { padding: 0; }
+.btn { &:hover { x: y; } }
+.card {
+  .cta { @extend %button; }
+  /* @extend .ignored; */
+}
+""")
+    self.write('pages.scss', """
+.page .link { @extend .btn, %button !optional; }
+.nav { @extend .link; }
+@extend .nowhere;
+""")
+    self.index = ExtendIndex([self.directory])
+    self.index.refresh()
+
+  def test_extenders(self):
+    """Records every extended selector with the rules extending it."""
+    self.assertEqual(sorted(self.index.extenders), ['%button', '.btn', '.link'])
+    self.assertEqual(self.index.extenders['%button'], [
+      (self.path('buttons.scss'), 69, 5, ['.card .cta']),
+      (self.path('pages.scss'), 15, 2, ['.page .link']),
+    ])
+
+  def test_extend(self):
+    """Substitutes extending rules, follows extensions of extensions and drops placeholders."""
+    self.assertEqual(self.index.extend(['.btn:hover']), ['.page .link:hover', '.page .nav:hover'])
+    self.assertEqual(self.index.extend(['%button']), ['.card .cta', '.page .link', '.page .nav'])
+    self.assertEqual(self.index.extend(['.btn-large']), [])
+
+  def test_expand_with_extends(self):
+    """Follows a rule's own selectors with those @extend adds, within max_selectors."""
+    string = '.btn { &:hover { x: y; } }'
+
+    sse = StringSCSSExpand(20, string, extends = self.index)
+    self.assertEqual(sse.coalesce_rule(), '.btn:hover, .page .link:hover, .page .nav:hover')
+
+    sse = StringSCSSExpand(20, string, max_selectors = 2, extends = self.index)
+    self.assertEqual(sse.coalesce_rule(), '.btn:hover, .page .link:hover ...and up to 1 more')
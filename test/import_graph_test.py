@@ -0,0 +1,77 @@
+import unittest, sys, os
+
+if sys.version < '3':
+  from src.src_two.import_graph import ImportGraph
+  from src.src_two.string_scss_expand import StringSCSSExpand
+  from src.src_two.expansion_cache import ExpansionCache
+else:
+  from src.src_three.import_graph import ImportGraph
+  from src.src_three.string_scss_expand import StringSCSSExpand
+  from src.src_three.expansion_cache import ExpansionCache
+
+from test.project_files import ProjectFiles
+
+
+class TestImportGraph(ProjectFiles, unittest.TestCase):
+
+  def setUp(self):
+    ProjectFiles.setUp(self)
+    self.write('main.scss', """
+@import 'base';
+// @import 'commented';
+.theme-dark, .theme-light {
+  @import 'components/buttons';
+}
+""")
+    self.write('_base.scss', '.base { @import "components/icons"; }')
+    self.write('components/_buttons.scss', '.btn { &:hover { x: y; } }')
+    self.write('components/_icons.scss', '@import "buttons";')
+    self.write('_commented.scss', '.c {}')
+
+  def test_importers(self):
+    """Records each import with the selectors of the rule around it."""
+    graph = ImportGraph([self.directory])
+    self.assertTrue(graph.refresh())
+
+    self.assertEqual(graph.importers[self.path('components/_buttons.scss')], [
+      (self.path('components/_icons.scss'), 0, 1, []),
+      (self.path('main.scss'), 71, 5, ['.theme-dark', '.theme-light']),
+    ])
+    self.assertEqual(graph.importers[self.path('_base.scss')], [(self.path('main.scss'), 1, 2, [])])
+    self.assertFalse(self.path('_commented.scss') in graph.importers)
+
+  def test_context(self):
+    """Follows imports of imports outwards to every selector a file is nested in."""
+    graph = ImportGraph([self.directory])
+    graph.refresh()
+
+    self.assertEqual(graph.context(self.path('components/_buttons.scss')),
+                     ['.base', '.theme-dark', '.theme-light'])
+    self.assertEqual(graph.context(self.path('_base.scss')), [])
+
+  def test_refresh_by_mtime(self):
+    """Rescans only files whose modification time has changed."""
+    graph = ImportGraph([self.directory])
+    graph.refresh()
+    self.assertFalse(graph.refresh())
+
+    self.write('_base.scss', '@import "components/icons";')
+    path = os.path.join(self.directory, '_base.scss')
+    os.utime(path, (0, 0))
+    self.assertTrue(graph.refresh())
+    self.assertEqual(graph.context(self.path('components/_buttons.scss')),
+                     ['', '.theme-dark', '.theme-light'])
+
+  def test_expand_with_context(self):
+    """Puts the context in front of every rule of the partial."""
+    string = '.btn { &:hover { x: y; } }'
+    context = ['', '.theme-dark']
+
+    sse = StringSCSSExpand(20, string, context = context)
+    self.assertEqual(sse.coalesce_rule(), ".btn:hover, .theme-dark .btn:hover")
+
+    analyzer = sse.analyze(len(string))
+    for position in [3, 20]:
+      uncached = StringSCSSExpand(position, string, analyzer, context = context).coalesce_rule()
+      cached = StringSCSSExpand(position, string, analyzer, cache = ExpansionCache(), context = context)
+      self.assertEqual(uncached, cached.coalesce_rule())
@@ -0,0 +1,112 @@
+import unittest, sys, os
+
+if sys.version < '3':
+  from src.src_two.buffer_provider import StringBuffer
+  from src.src_two.index_store import IndexStore
+  from src.src_two.reparse import reparse
+  from src.src_two.scss_analyzer import ScssAnalyzer
+  from src.src_two.string_scss_expand import StringSCSSExpand
+else:
+  from src.src_three.buffer_provider import StringBuffer
+  from src.src_three.index_store import IndexStore
+  from src.src_three.reparse import reparse
+  from src.src_three.scss_analyzer import ScssAnalyzer
+  from src.src_three.string_scss_expand import StringSCSSExpand
+
+from test.project_files import ProjectFiles
+
+
+class TestIndexStore(ProjectFiles, unittest.TestCase):
+
+  string = u""".a, .b { /* { */ c: "}";
+  .d-#{$e} { @at-root .f { g: h; } }
+  // .caf\u00e9 {
+}
+@media print { .x { y: z; } }"""
+
+  def test_round_trip(self):
+    """Reads back an analysis that answers every query the same way."""
+    store = IndexStore(self.directory)
+    buffer = StringBuffer(self.string)
+    built = ScssAnalyzer(buffer.char_at, buffer.size())
+    key = store.key(self.string)
+    store.save(key, built)
+    loaded = store.load(key, version = 7)
+
+    self.assertEqual(loaded.version, 7)
+    self.assertEqual(list(loaded.comments), list(built.comments))
+    self.assertEqual([scope.text for scope in loaded.scopes], [scope.text for scope in built.scopes])
+    for pos in range(len(self.string) + 1):
+      self.assertEqual(loaded.enclosing(pos), built.enclosing(pos))
+      self.assertEqual(StringSCSSExpand(pos, self.string, loaded).coalesce_rule(),
+                       StringSCSSExpand(pos, self.string).coalesce_rule())
+
+  def test_edited_round_trip(self):
+    """Writes out an analysis patched up after an edit as it stands."""
+    store = IndexStore(self.directory)
+    start = self.string.index('g: h')
+    string = self.string[:start] + '.i { j: k; } ' + self.string[start:]
+    buffer = StringBuffer(string)
+    edited = reparse(ScssAnalyzer(StringBuffer(self.string).char_at, len(self.string)),
+                     start, start, start + 13, buffer.char_at, buffer.size())
+    store.save('edited', edited)
+    loaded = store.load('edited')
+
+    self.assertEqual(list(loaded.parents), list(edited.parents))
+    self.assertEqual([(scope.start, scope.text) for scope in loaded.scopes],
+                     [(scope.start, scope.text) for scope in edited.scopes])
+    for pos in range(len(string) + 1):
+      self.assertEqual(StringSCSSExpand(pos, string, loaded).coalesce_rule(),
+                       StringSCSSExpand(pos, string).coalesce_rule())
+
+  def test_keys(self):
+    """Keys a text apart from its own bytes and from any other text."""
+    store = IndexStore(self.directory)
+
+    self.assertEqual(store.key(u'.a {}'), store.key(u'.a {}'))
+    self.assertNotEqual(store.key(u'.a {}'), store.key(u'.b {}'))
+    self.assertNotEqual(store.key(u'.a {}'), store.key(b'.a {}'))
+
+  def test_missing_or_damaged(self):
+    """Treats a missing or unreadable file as not stored, and builds instead."""
+    store = IndexStore(self.directory)
+    key = store.key(self.string)
+    self.assertEqual(store.load(key), None)
+
+    with open(store.path(key), 'wb') as handle:
+      handle.write(b'not an index')
+    self.assertEqual(store.load(key), None)
+
+    buffer = StringBuffer(self.string)
+    analyzer = store.analyzer(key, buffer.char_at, buffer.size())
+    self.assertEqual(len(analyzer), 5)
+    self.assertEqual(len(store.load(key)), 5)
+
+  def test_eviction(self):
+    """Deletes the files used longest ago once over the size limit."""
+    store = IndexStore(self.directory)
+    buffer = StringBuffer(self.string)
+    analyzer = ScssAnalyzer(buffer.char_at, buffer.size())
+    store.save('first', analyzer)
+    store.max_bytes = os.path.getsize(store.path('first')) * 2
+    os.utime(store.path('first'), (0, 0))
+    store.save('second', analyzer)
+    store.save('third', analyzer)
+
+    self.assertEqual(sorted(os.listdir(self.directory)), ['second.idx', 'third.idx'])
+
+  def test_workers_leave_eviction(self):
+    """Saves from workers over the size limit until the store evicts."""
+    store = IndexStore(self.directory)
+    buffer = StringBuffer(self.string)
+    analyzer = ScssAnalyzer(buffer.char_at, buffer.size())
+    store.save('first', analyzer)
+    store.max_bytes = os.path.getsize(store.path('first')) * 2
+    os.utime(store.path('first'), (0, 0))
+    workers = store.for_workers()
+    workers.save('second', analyzer)
+    workers.save('third', analyzer)
+
+    self.assertEqual(len(os.listdir(self.directory)), 3)
+    store.evict()
+    self.assertEqual(sorted(os.listdir(self.directory)), ['second.idx', 'third.idx'])
@@ -0,0 +1,201 @@
+import unittest, sys, os, types
+
+if sys.version < '3':
+  from src.src_two.buffer_provider import StringBuffer
+  from src.src_two.scss_analyzer import ScssAnalyzer
+else:
+  from src.src_three.buffer_provider import StringBuffer
+  from src.src_three.scss_analyzer import ScssAnalyzer
+
+
+# Just enough of Sublime Text 4's API to load the plugin outside the
+# editor. Callbacks given to set_timeout and set_timeout_async wait in
+# pending until the test runs them.
+pending = []
+settings = {'persistent_index': False}
+
+class Region():
+  def __init__(self, a, b = None):
+    self.a = a
+    self.b = a if b is None else b
+
+  def begin(self):
+    return min(self.a, self.b)
+
+  def end(self):
+    return max(self.a, self.b)
+
+class Settings():
+  def get(self, key, default = None):
+    return settings.get(key, default)
+
+sublime = types.ModuleType('sublime')
+sublime.Region = Region
+sublime.load_settings = lambda name: Settings()
+sublime.set_timeout = lambda callback, delay = 0: pending.append(callback)
+sublime.set_timeout_async = lambda callback, delay = 0: pending.append(callback)
+sublime.status_message = lambda text: None
+
+class TextChangeListener():
+  def __init__(self):
+    self.buffer = None
+
+  @classmethod
+  def is_applicable(cls, buffer):
+    return False
+
+  def attach(self, buffer):
+    self.buffer = buffer
+    buffer.listeners.append(self)
+
+  def is_attached(self):
+    return self.buffer is not None
+
+sublime_plugin = types.ModuleType('sublime_plugin')
+sublime_plugin.EventListener = object
+sublime_plugin.TextCommand = object
+sublime_plugin.WindowCommand = object
+sublime_plugin.TextChangeListener = TextChangeListener
+
+class HistoricPosition():
+  def __init__(self, pt):
+    self.pt = pt
+
+class TextChange():
+  def __init__(self, a, b, text):
+    self.a = HistoricPosition(a)
+    self.b = HistoricPosition(b)
+    self.str = text
+
+class Buffer():
+  def __init__(self, view):
+    self.view = view
+    self.listeners = []
+
+  def id(self):
+    return self.view.id()
+
+  def primary_view(self):
+    return self.view
+
+class View():
+  def __init__(self, text, syntax = 'source.scss'):
+    self.text = text
+    self.syntax = syntax
+    self.count = 1
+    self.text_buffer = Buffer(self)
+
+  def id(self):
+    return id(self)
+
+  def buffer(self):
+    return self.text_buffer
+
+  def window(self):
+    return None
+
+  def file_name(self):
+    return None
+
+  def is_valid(self):
+    return True
+
+  def change_count(self):
+    return self.count
+
+  def size(self):
+    return len(self.text)
+
+  def substr(self, region):
+    return self.text[region.begin():region.end()]
+
+  def score_selector(self, pt, selector):
+    return 1 if selector == self.syntax else 0
+
+  def replace(self, start, end, text):
+    self.text = self.text[:start] + text + self.text[end:]
+    self.count += 1
+    for listener in self.text_buffer.listeners:
+      listener.on_text_changed([TextChange(start, end, text)])
+
+
+def load_plugin():
+  sys.modules['sublime'] = sublime
+  sys.modules['sublime_plugin'] = sublime_plugin
+  # the plugin imports its engine relative to the package it is in
+  package = types.ModuleType('scss_expander_package')
+  package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+  sys.modules['scss_expander_package'] = package
+  __import__('scss_expander_package.scss_expander')
+  return sys.modules['scss_expander_package.scss_expander']
+
+plugin = load_plugin()
+
+
+class TestPlugin(unittest.TestCase):
+
+  def setUp(self):
+    del pending[:]
+    self.listener = plugin.ScssexpanderListener()
+
+  def run_pending(self):
+    while pending:
+      pending.pop(0)()
+
+  def assert_current(self, view):
+    """The plugin's analysis of the view is the one a full scan gives."""
+    analyzer = plugin.analyzers.current(view)
+    self.assertTrue(analyzer is not None)
+    expected = ScssAnalyzer(StringBuffer(view.text).char_at, len(view.text))
+    self.assertEqual(list(analyzer.tokens.starts), list(expected.tokens.starts))
+    self.assertEqual(list(analyzer.opens), list(expected.opens))
+    self.assertEqual(list(analyzer.closes), list(expected.closes))
+
+  def test_edits_are_spliced(self):
+    """Edits to a loaded SCSS view are folded into its analysis."""
+    view = View('.a, .b {\n  .c { d: e; }\n}\n')
+    self.listener.on_load(view)
+    self.listener.on_load_async(view)
+    self.run_pending()
+    self.assertEqual(len(view.buffer().listeners), 1)
+    position = view.text.index('d: e')
+    for text in ('x', 'y', ' .f { g: h; }'):
+      view.replace(position, position, text)
+      self.assertEqual(len(pending), 1)
+      # just the splice, before any rebuild
+      pending.pop(0)()
+      self.assert_current(view)
+
+  def test_follows_views_once(self):
+    """A view is followed by one listener however often it is seen."""
+    view = View('.a { b: c; }')
+    self.listener.on_load(view)
+    self.listener.on_modified(view)
+    self.assertEqual(len(view.buffer().listeners), 1)
+
+  def test_other_syntaxes_ignored(self):
+    """Views in other syntaxes are left alone."""
+    view = View('.a { b: c; }', 'source.css')
+    self.listener.on_load(view)
+    self.listener.on_modified(view)
+    self.assertEqual(view.buffer().listeners, [])
+
+  def test_sublime_text_2_waits_for_a_pause(self):
+    """Without an async thread, typing only schedules the analysis."""
+    plugin.ASYNC = False
+    try:
+      view = View('.a { b: c; }')
+      for text in ('x', 'y'):
+        view.text += text
+        view.count += 1
+        self.listener.on_modified(view)
+      self.assertEqual(plugin.analyzers.current(view), None)
+      # only the build for the last edit does anything
+      self.assertEqual(len(pending), 2)
+      pending.pop(1)()
+      self.assert_current(view)
+      analyzer = plugin.analyzers.current(view)
+      pending.pop(0)()
+      self.assertTrue(plugin.analyzers.current(view) is analyzer)
+    finally:
+      plugin.ASYNC = True
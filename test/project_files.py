@@ -0,0 +1,21 @@
+import io, os, shutil, tempfile
+
+# Mixed into the test cases that need files on disk: every test gets a
+# fresh temporary directory, deleted again after it. write() creates the
+# folders a name asks for; path() gives a name as the indexes key it.
+class ProjectFiles():
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, name, text):
+    path = os.path.join(self.directory, name)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with io.open(path, 'wb') as handle:
+      handle.write(text.encode('utf-8'))
+
+  def path(self, name):
+    return os.path.normcase(os.path.abspath(os.path.join(self.directory, name)))
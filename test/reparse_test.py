@@ -0,0 +1,95 @@
+import unittest, sys
+
+if sys.version < '3':
+  from src.src_two.buffer_provider import StringBuffer
+  from src.src_two.reparse import reparse
+  from src.src_two.scss_analyzer import ScssAnalyzer
+  from src.src_two.string_scss_expand import StringSCSSExpand
+else:
+  from src.src_three.buffer_provider import StringBuffer
+  from src.src_three.reparse import reparse
+  from src.src_three.scss_analyzer import ScssAnalyzer
+  from src.src_three.string_scss_expand import StringSCSSExpand
+
+
+class TestReparse(unittest.TestCase):
+
+  string = """.a, .b { /* { */ c: "}";
+  .d-#{$e} { @at-root .f { g: h; } }
+  .i { j: k; }
+}
+@media print { .x { y: z; } }"""
+
+  def analyze(self, string):
+    buffer = StringBuffer(string)
+    return ScssAnalyzer(buffer.char_at, buffer.size())
+
+  def edit(self, string, start, end, text):
+    """The reparsed analysis after replacing string[start:end] with text."""
+    edited = string[:start] + text + string[end:]
+    buffer = StringBuffer(edited)
+    analyzer = reparse(self.analyze(string), start, end, start + len(text),
+                       buffer.char_at, buffer.size(), 'edited')
+    return edited, analyzer
+
+  def assertSameAnalysis(self, string, analyzer):
+    built = self.analyze(string)
+    self.assertEqual(list(analyzer.tokens.kinds), list(built.tokens.kinds))
+    self.assertEqual(list(analyzer.tokens.starts), list(built.tokens.starts))
+    self.assertEqual(list(analyzer.comments), list(built.comments))
+    self.assertEqual(list(analyzer.opens), list(built.opens))
+    self.assertEqual(list(analyzer.closes), list(built.closes))
+    self.assertEqual(list(analyzer.parents), list(built.parents))
+    self.assertEqual(list(analyzer.depths), list(built.depths))
+    self.assertEqual([(scope.start, scope.end, scope.text) for scope in analyzer.scopes],
+                     [(scope.start, scope.end, scope.text) for scope in built.scopes])
+    for pos in range(len(string) + 1):
+      self.assertEqual(StringSCSSExpand(pos, string, analyzer).coalesce_rule(),
+                       StringSCSSExpand(pos, string).coalesce_rule())
+
+  def test_edit_inside_block(self):
+    """Relexes only the block around an edit and moves what follows along."""
+    start = self.string.index('g: h')
+    string, analyzer = self.edit(self.string, start, start + 4, '.m { n: o; } /* p */')
+
+    self.assertEqual(analyzer.version, 'edited')
+    self.assertEqual(len(analyzer), 7)
+    self.assertSameAnalysis(string, analyzer)
+
+  def test_removing_a_block(self):
+    """Renumbers the blocks after one that is deleted."""
+    start = self.string.index('.i')
+    end = self.string.index('}', start) + 1
+    string, analyzer = self.edit(self.string, start, end, '')
+
+    self.assertEqual(len(analyzer), 5)
+    self.assertSameAnalysis(string, analyzer)
+
+  def test_widens_to_enclosing_block(self):
+    """Falls back on an outer block when the inner one's braces change."""
+    start = self.string.index('{ g')
+    string, analyzer = self.edit(self.string, start, start + 1, '.q {')
+
+    self.assertSameAnalysis(string, analyzer)
+
+  def test_chained_edits(self):
+    """Keeps up with edits made one after another on either side of each other."""
+    string = self.string
+    analyzer = self.analyze(string)
+    for anchor, text in [('g: h', 'x'), ('c:', ' .n { o: p; }'), ('g: h', '/* q */'), ('y: z', 'r: s;')]:
+      start = string.index(anchor)
+      string = string[:start] + text + string[start:]
+      buffer = StringBuffer(string)
+      analyzer = reparse(analyzer, start, start, start + len(text), buffer.char_at, buffer.size())
+      self.assertSameAnalysis(string, analyzer)
+
+  def test_needs_full_analysis(self):
+    """Gives up on edits at the top level or that reach past their block."""
+    top = self.string.index('@media')
+    self.assertEqual(self.edit(self.string, top, top, '.r {}')[1], None)
+
+    comment = self.string.index('c:')
+    self.assertEqual(self.edit(self.string, comment, comment, '/*')[1], None)
+
+    unclosed = '.a { .b { c: d; }'
+    self.assertEqual(self.edit(unclosed, 12, 12, '}')[1], None)
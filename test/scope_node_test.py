@@ -0,0 +1,52 @@
+import unittest, sys
+
+if sys.version < '3':
+  from src.src_two.scope_node import ScopeNode, RULE, DIRECTIVE, CONTROL, AT_ROOT
+else:
+  from src.src_three.scope_node import ScopeNode, RULE, DIRECTIVE, CONTROL, AT_ROOT
+
+
+class TestScopeNode(unittest.TestCase):
+
+  def test_rule(self):
+    """Splits a rule into its comma-separated parts."""
+    scope = ScopeNode(0, 10, ".foo, .bar")
+
+    self.assertEqual(scope.kind, RULE)
+    self.assertEqual(scope.parts, [".foo", " .bar"])
+    self.assertTrue(scope.is_rule())
+
+  def test_directive(self):
+    """Keeps a directive whole and remembers its name."""
+    scope = ScopeNode(0, 10, "@media print, screen")
+
+    self.assertEqual(scope.kind, DIRECTIVE)
+    self.assertEqual(scope.name, "media")
+    self.assertEqual(scope.parts, ["@media print, screen"])
+    self.assertFalse(scope.is_rule())
+
+  def test_control(self):
+    """Recognises control directives."""
+    for text in ("@for $i from 1 through 3", "@each $a in b", "@if $a", "@else", "@while $i > 0"):
+      self.assertEqual(ScopeNode(0, 0, text).kind, CONTROL)
+
+  def test_at_root(self):
+    """Parses the arguments of @at-root and what follows it."""
+    scope = ScopeNode(0, 10, "@at-root (without: media supports) .bar, .baz")
+
+    self.assertEqual(scope.kind, AT_ROOT)
+    self.assertEqual(scope.exclusion, "without")
+    self.assertEqual(scope.directives, ("media", "supports"))
+    self.assertEqual(scope.parts, [".bar", " .baz"])
+    self.assertTrue(scope.is_rule())
+    self.assertFalse(ScopeNode(0, 10, "@at-root").is_rule())
+
+  def test_nested_property(self):
+    """Does not count nested properties as rules."""
+    self.assertFalse(ScopeNode(0, 5, "font:").is_rule())
+
+  def test_slots(self):
+    """Has no per-instance dictionary."""
+    scope = ScopeNode(0, 4, ".foo")
+
+    self.assertFalse(hasattr(scope, "__dict__"))
@@ -0,0 +1,76 @@
+import unittest, sys
+
+if sys.version < '3':
+  from src.src_two.buffer_provider import StringBuffer
+  from src.src_two.scss_analyzer import ScssAnalyzer
+else:
+  from src.src_three.buffer_provider import StringBuffer
+  from src.src_three.scss_analyzer import ScssAnalyzer
+
+
+def analyze(string):
+  buffer = StringBuffer(string)
+  return ScssAnalyzer(buffer.char_at, buffer.size())
+
+
+class TestScssAnalyzer(unittest.TestCase):
+
+  def test_block_tree(self):
+    """Records where every block opens and closes and which block it is nested in."""
+    string = ".a{.b{}.c{.d{}}}.e{}"
+    analyzer = analyze(string)
+
+    self.assertEqual(list(analyzer.opens), [2, 5, 9, 12, 18])
+    self.assertEqual(list(analyzer.closes), [15, 6, 14, 13, 19])
+    self.assertEqual(list(analyzer.parents), [-1, 0, 0, 2, -1])
+    self.assertEqual(list(analyzer.depths), [0, 1, 1, 2, 0])
+    self.assertEqual([scope.text for scope in analyzer.scopes], [".a", ".b", ".c", ".d", ".e"])
+
+  def test_enclosing(self):
+    """Answers which blocks enclose an offset, braces included."""
+    string = ".a{.b{}.c{.d{}}}.e{}"
+    analyzer = analyze(string)
+
+    self.assertEqual(analyzer.enclosing(0), [])
+    self.assertEqual(analyzer.enclosing(2), [0])
+    self.assertEqual(analyzer.enclosing(6), [0, 1])
+    self.assertEqual(analyzer.enclosing(7), [0])
+    self.assertEqual(analyzer.enclosing(13), [0, 2, 3])
+    self.assertEqual(analyzer.enclosing(15), [0])
+    self.assertEqual(analyzer.enclosing(16), [])
+    self.assertEqual(analyzer.enclosing(19), [4])
+
+  def test_enclosing_skips_earlier_siblings(self):
+    """Finds the parent of a block preceded by many closed siblings."""
+    string = ".p{" + ".s{x:y}" * 500 + ".t{z:w}}"
+    analyzer = analyze(string)
+    position = string.index("z:w")
+
+    self.assertEqual([analyzer.scopes[block].text for block in analyzer.enclosing(position)], [".p", ".t"])
+
+  def test_unbalanced(self):
+    """Leaves unclosed blocks open to the end and ignores stray closing braces."""
+    string = "} .a { .b { top: 0 "
+    analyzer = analyze(string)
+
+    self.assertEqual(list(analyzer.closes), [len(string), len(string)])
+    self.assertEqual(analyzer.enclosing(len(string) - 1), [0, 1])
+
+  def test_cursor_in_comment(self):
+    """Places a cursor inside a comment where the comment starts."""
+    string = ".a { /* } .x { */ }"
+    analyzer = analyze(string)
+
+    self.assertEqual(analyzer.enclosing(12), [0])
+
+  def test_enclosing_many(self):
+    """Gives the same chains as one query per offset, in the order asked for."""
+    string = ".a{.b{}.c{.d{ /* } */ }}}.e{ x: #{y}; }"
+    analyzer = analyze(string)
+    positions = [len(string) - 1, 0, 17, 6, 13, 7, 2, 33, 25]
+
+    actual_chains = analyzer.enclosing_many(positions)
+    expected_chains = [analyzer.enclosing(pos) for pos in positions]
+
+    self.assertEqual(actual_chains, expected_chains)
+    self.assertEqual(analyzer.enclosing_many([]), [])
@@ -0,0 +1,85 @@
+import random
+
+# Generates synthetic but well-formed SCSS for benchmarking. Every knob
+# maps onto something the expander has to walk through:
+#   size               approximate length of the text in characters
+#   depth              how deeply rules nest
+#   siblings           child rules in each rule that is not at the bottom
+#   declarations       declarations in each rule
+#   comment_density    chance of a comment before each declaration and rule
+#   comma_width        alternatives in each comma-separated selector
+#   at_root_frequency  chance that a nested rule uses @at-root
+# The same parameters and seed always give the same text.
+class ScssCorpus():
+  def __init__(self, size = 20000, depth = 4, siblings = 3, declarations = 3,
+               comment_density = 0.1, comma_width = 1, at_root_frequency = 0.0, seed = 1):
+    self.size = size
+    self.depth = depth
+    self.siblings = siblings
+    self.declarations = declarations
+    self.comment_density = comment_density
+    self.comma_width = comma_width
+    self.at_root_frequency = at_root_frequency
+    self.seed = seed
+
+  def generate(self):
+    self.random = random.Random(self.seed)
+    self.counter = 0
+    parts = []
+    length = 0
+    while length < self.size:
+      block = self.rule(0)
+      parts.append(block)
+      length += len(block)
+    return ''.join(parts)
+
+  def name(self):
+    self.counter += 1
+    return 'c%d' % self.counter
+
+  def comment(self, indent):
+    if self.random.random() >= self.comment_density:
+      return ''
+    if self.random.random() < 0.5:
+      return '%s// note %d { not a rule }\n' % (indent, self.counter)
+    return '%s/* note %d\n%s   { still not a rule } */\n' % (indent, self.counter, indent)
+
+  def selector(self, level):
+    alternatives = []
+    for _ in range(self.comma_width):
+      name = self.name()
+      if level > 0 and self.random.random() < 0.3:
+        alternatives.append('&.%s' % name)
+      elif self.random.random() < 0.1:
+        alternatives.append('.%s-#{$theme}' % name)
+      else:
+        alternatives.append('.%s' % name)
+    selector = ', '.join(alternatives)
+    if level > 0 and self.random.random() < self.at_root_frequency:
+      selector = '@at-root ' + selector
+    return selector
+
+  def rule(self, level):
+    indent = '  ' * level
+    inner = indent + '  '
+    lines = [self.comment(indent), '%s%s {\n' % (indent, self.selector(level))]
+    for number in range(self.declarations):
+      lines.append(self.comment(inner))
+      lines.append('%sprop-%d: %dpx;\n' % (inner, number, self.random.randint(0, 100)))
+    if level < self.depth:
+      for _ in range(self.siblings):
+        lines.append(self.rule(level + 1))
+    lines.append('%s}\n' % indent)
+    return ''.join(lines)
+
+  # Offsets just inside declarations, spread evenly over the text
+  def positions(self, text, count):
+    candidates = []
+    start = text.find('prop-')
+    while start >= 0:
+      candidates.append(start)
+      start = text.find('prop-', start + 1)
+    if not candidates:
+      return []
+    step = max(len(candidates) // count, 1)
+    return candidates[::step][:count]
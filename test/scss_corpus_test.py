@@ -0,0 +1,31 @@
+import unittest, sys
+
+if sys.version < '3':
+  from src.src_two.string_scss_expand import StringSCSSExpand
+else:
+  from src.src_three.string_scss_expand import StringSCSSExpand
+
+from test.scss_corpus import ScssCorpus
+
+
+class TestScssCorpus(unittest.TestCase):
+
+  def test_deterministic(self):
+    """Generates the same text for the same parameters and seed."""
+    first = ScssCorpus(size = 2000, comment_density = 0.5, seed = 7).generate()
+    second = ScssCorpus(size = 2000, comment_density = 0.5, seed = 7).generate()
+
+    self.assertEqual(first, second)
+    self.assertTrue(len(first) >= 2000)
+
+  def test_well_formed(self):
+    """Generates text whose every block is closed and can be expanded."""
+    corpus = ScssCorpus(size = 3000, depth = 3, siblings = 2, comment_density = 0.5,
+                        comma_width = 2, at_root_frequency = 0.3)
+    text = corpus.generate()
+    analyzer = StringSCSSExpand(0, text).analyze(len(text))
+
+    self.assertTrue(len(analyzer) > 0)
+    self.assertTrue(all(close < len(text) for close in analyzer.closes))
+    for position in corpus.positions(text, 10):
+      self.assertNotEqual(StringSCSSExpand(position, text).coalesce_rule(), "")
@@ -1,9 +1,13 @@
 import unittest, sys
 
 if sys.version < '3':
+  from src.src_two.scss_expand import SCSSExpand
   from src.src_two.string_scss_expand import StringSCSSExpand
+  from src.src_two.expansion_cache import ExpansionCache
 else:
+  from src.src_three.scss_expand import SCSSExpand
   from src.src_three.string_scss_expand import StringSCSSExpand
+  from src.src_three.expansion_cache import ExpansionCache
 
 
 class TestScssExpand(unittest.TestCase):
@@ -619,7 +623,7 @@ $bim: 22;
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(9)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(0, 9)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -638,7 +642,7 @@ $bim: 22;
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(64)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(25, 46)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -657,7 +661,7 @@ $bim: 22;
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(64)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(25, 48)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -677,7 +681,7 @@ $bim: 22;
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(80)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(1, 17), (42, 65)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -688,7 +692,7 @@ $bim: 22;
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(11)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(0, 10)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -709,7 +713,7 @@ Things in here.
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(63)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(26, 47)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -730,7 +734,7 @@ Things in here. // like this
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(80)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(26, 60)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -752,7 +756,7 @@ Things in here. // like this
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(90)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(26, 69)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -777,7 +781,7 @@ Things in here. // like this
     """
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(193)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(0, 175)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -798,7 +802,7 @@ Things in here. // like this
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(220)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(1, 3), (4, 34), (35, 88)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -823,7 +827,7 @@ Things in here. // like this
 
     sse = StringSCSSExpand(0, string)
     sse.comment_machine(138)
-    actual_comments = sse.comment_blocks
+    actual_comments = list(sse.comment_blocks)
     expected_comments = [(26, 41), (44, 87), (113, 129), (131, 137)]
 
     self.assertEqual(actual_comments, expected_comments)
@@ -866,3 +870,263 @@ Things in here. // like this
       expected_rule = ".some-rule"
 
       self.assertEqual(actual_rule, expected_rule)
+
+  def test_prebuilt_analyzer(self):
+    """Gives the same results when handed an analyzer of the whole text."""
+    string = """
+.foo, .bar {
+  /*
+    .comment-rule {}}{}{{{{{{{{}}}
+   */
+      .baz, .bang {
+        outline: none;
+      }
+  // }
+}
+.after {
+  /* .commented { */
+  top: 0;
+}
+    """
+    analyzer = StringSCSSExpand(0, string).analyze(len(string))
+
+    for position in (102, 140, 146):
+      expected_rule = StringSCSSExpand(position, string).coalesce_rule()
+      actual_rule = StringSCSSExpand(position, string, analyzer).coalesce_rule()
+      self.assertEqual(actual_rule, expected_rule)
+
+  def test_prebuilt_analyzer_cursor_in_comment(self):
+    """Searches outside the comment scope when an analyzer of the whole text is given."""
+    string = """
+.baz {
+  height: 10px;
+  /* .foo, .bar {
+    width: 14px;
+  }
+  */
+}
+    """
+    analyzer = StringSCSSExpand(0, string).analyze(len(string))
+
+    sse = StringSCSSExpand(48, string, analyzer)
+    actual_rule = sse.coalesce_rule()
+    expected_rule = ".baz"
+
+    self.assertEqual(actual_rule, expected_rule)
+
+  def test_braces_in_strings(self):
+    """Does not get thrown off by brackets inside quoted strings."""
+    string = """
+.foo {
+  .bar {
+    content: "}}";
+    &:after { content: '{'; }
+    top: 0;
+  }
+}
+    """
+    sse = StringSCSSExpand(72, string)
+    actual_rule = sse.coalesce_rule()
+    expected_rule = ".foo .bar"
+
+    self.assertEqual(actual_rule, expected_rule)
+
+  def test_consecutive_single_line_comments(self):
+    """Leaves out every single-line comment above a rule."""
+    string = """
+.foo {
+  // first
+  // second
+  .bar {
+    top: 0;
+  }
+}
+    """
+    sse = StringSCSSExpand(45, string)
+    actual_rule = sse.coalesce_rule()
+    expected_rule = ".foo .bar"
+
+    self.assertEqual(actual_rule, expected_rule)
+
+  def test_many_positions(self):
+    """Expands the rules at several cursors in one go."""
+    string = """
+.foo, .bar {
+  .baz {
+    top: 0;
+  }
+  &:hover {
+    top: 1px;
+  }
+}
+.bim {
+  left: 0;
+}
+    """
+    positions = [string.index("left"), string.index("top: 0"), string.index("top: 1px"), 0]
+    sse = StringSCSSExpand(positions[0], string)
+    actual_rules = sse.coalesce_rules(positions)
+    expected_rules = [".bim", ".foo .baz, .bar .baz", ".foo:hover, .bar:hover", ""]
+
+    self.assertEqual(actual_rules, expected_rules)
+
+  def test_expand_all(self):
+    """Lists every rule in the text with its block and compiled selectors."""
+    string = """
+// .commented {
+@media screen {
+  .foo, .bar {
+    &:hover { top: 0; }
+    @for $i from 1 through 3 {
+      .col-#{$i} { width: 1px; }
+    }
+    @at-root .baz { top: 0; }
+    font: {
+      family: serif;
+    }
+  }
+}
+"""
+    sse = StringSCSSExpand(0, string)
+    actual_rules = [(string[start], string[end], selectors) for start, end, selectors in sse.expand_all()]
+    expected_rules = [
+      ("{", "}", ["@media screen .foo", "@media screen .bar"]),
+      ("{", "}", ["@media screen .foo:hover", "@media screen .bar:hover"]),
+      ("{", "}", ["@media screen .foo .col-#{$i}", "@media screen .bar .col-#{$i}"]),
+      ("{", "}", ["@media screen .baz"]),
+    ]
+
+    self.assertEqual(actual_rules, expected_rules)
+
+  def test_expand_all_is_lazy(self):
+    """Yields rules one at a time in document order."""
+    string = ".a { .b {} } .c {}"
+    rules = StringSCSSExpand(0, string).expand_all()
+
+    self.assertEqual(next(rules), (3, 11, [".a"]))
+    self.assertEqual(next(rules), (8, 9, [".a .b"]))
+    self.assertEqual(next(rules), (16, 17, [".c"]))
+    self.assertRaises(StopIteration, next, rules)
+
+  def test_expand_all_needs_an_end(self):
+    """Asks for the end of a text it only has characters of."""
+    string = ".a { .b {} }"
+    get_char = lambda pos: string[pos]
+
+    self.assertRaises(ValueError, list, SCSSExpand(0, get_char).expand_all())
+    self.assertEqual(len(list(SCSSExpand(0, get_char).expand_all(len(string)))), 2)
+
+  def test_duplicate_selectors(self):
+    """Lists a selector produced more than once only once."""
+    string = """
+.foo, .foo {
+  .bar, .bar {
+    top: 0;
+  }
+}
+    """
+    sse = StringSCSSExpand(32, string)
+    actual_rule = sse.coalesce_rule()
+    expected_rule = ".foo .bar"
+
+    self.assertEqual(actual_rule, expected_rule)
+    self.assertEqual(sse.expanded_count, 4)
+
+  def test_capped_expansion(self):
+    """Stops after the maximum number of selectors and says how many are left."""
+    string = ".a, .b { .c, .d { .e, .f { top: 0; } } }"
+    sse = StringSCSSExpand(30, string, max_selectors = 3)
+    actual_rule = sse.coalesce_rule()
+    expected_rule = ".a .c .e, .a .c .f, .a .d .e ...and up to 5 more"
+
+    self.assertEqual(actual_rule, expected_rule)
+
+  def test_capped_expansion_duplicates(self):
+    """Counts only distinct selectors as left out, with or without the cache."""
+    string = ".a, .a { .b, .c, .b { top: 0; } }"
+    analyzer = StringSCSSExpand(0, string).analyze(len(string))
+    uncached = StringSCSSExpand(20, string, max_selectors = 1)
+    cached = StringSCSSExpand(20, string, analyzer, max_selectors = 1, cache = ExpansionCache())
+    batch = StringSCSSExpand(0, string, analyzer, max_selectors = 1, cache = ExpansionCache())
+    expected_rule = ".a .b ...and up to 1 more"
+
+    self.assertEqual(uncached.coalesce_rule(), expected_rule)
+    self.assertEqual(cached.coalesce_rule(), expected_rule)
+    self.assertEqual(batch.coalesce_rules([20]), [expected_rule])
+
+  def test_capped_expansion_is_lazy(self):
+    """Does not build every combination of a huge comma product."""
+    string = "".join(".a%d, .b%d, .c%d, .d%d {" % (level, level, level, level) for level in range(12))
+    string += " top: 0; " + "}" * 12
+    sse = StringSCSSExpand(string.index("top"), string, max_selectors = 2)
+    actual_rule = sse.coalesce_rule()
+
+    self.assertEqual(sse.expanded_count, 4 ** 12)
+    self.assertEqual(len(sse.selectors), 2)
+    self.assertTrue(actual_rule.endswith("...and up to 16,777,214 more"))
+
+  def test_cached_expansion(self):
+    """Reuses the expansion of enclosing blocks across queries."""
+    string = """
+.foo, .bar {
+  .baz {
+    &:hover { top: 0; }
+    .bang { top: 1px; }
+  }
+}
+    """
+    analyzer = StringSCSSExpand(0, string).analyze(len(string))
+    cache = ExpansionCache()
+
+    sse = StringSCSSExpand(string.index("top: 0"), string, analyzer, cache = cache)
+    self.assertEqual(sse.coalesce_rule(), ".foo .baz:hover, .bar .baz:hover")
+    self.assertEqual(len(cache), 3)
+
+    sse = StringSCSSExpand(string.index("top: 1px"), string, analyzer, cache = cache)
+    self.assertEqual(sse.coalesce_rule(), ".foo .baz .bang, .bar .baz .bang")
+    self.assertEqual(len(cache), 4)
+
+    hits = cache.hits
+    sse = StringSCSSExpand(string.index("top: 1px"), string, analyzer, cache = cache)
+    self.assertEqual(sse.coalesce_rule(), ".foo .baz .bang, .bar .baz .bang")
+    self.assertEqual(cache.hits, hits + 1)
+
+  def test_cached_expansion_at_root(self):
+    """Gives the same results from the cache when @at-root drops ancestors."""
+    string = """
+@media screen {
+  .foo {
+    @at-root(without: media) .bar {
+      .baz { top: 0; }
+    }
+  }
+}
+    """
+    analyzer = StringSCSSExpand(0, string).analyze(len(string))
+    cache = ExpansionCache()
+    position = string.index("top")
+
+    sse = StringSCSSExpand(position, string, analyzer, cache = cache)
+    actual_rule = sse.coalesce_rule()
+    expected_rule = StringSCSSExpand(position, string).coalesce_rule()
+
+    self.assertEqual(actual_rule, expected_rule)
+    self.assertEqual(actual_rule, ".bar .baz")
+
+  def test_top_level_at_root(self):
+    """Strips @at-root from a rule that is already at the root."""
+    string = "@at-root .foo { .bar { top: 0; } }"
+    sse = StringSCSSExpand(25, string)
+    actual_rule = sse.coalesce_rule()
+    expected_rule = ".foo .bar"
+
+    self.assertEqual(actual_rule, expected_rule)
+
+  def test_nested_at_root(self):
+    """Lets the innermost @at-root decide what is kept."""
+    string = ".a { @at-root .b { @at-root .c { top: 0; } } }"
+    sse = StringSCSSExpand(35, string)
+    actual_rule = sse.coalesce_rule()
+    expected_rule = ".c"
+
+    self.assertEqual(actual_rule, expected_rule)
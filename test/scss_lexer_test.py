@@ -0,0 +1,99 @@
+import unittest, sys
+
+if sys.version < '3':
+  from src.src_two.buffer_provider import StringBuffer
+  from src.src_two.scss_lexer import ScssLexer, BuildCancelled, OPEN, CLOSE, SEMICOLON, TEXT, COMMENT, INTERPOLATION, STRING
+else:
+  from src.src_three.buffer_provider import StringBuffer
+  from src.src_three.scss_lexer import ScssLexer, BuildCancelled, OPEN, CLOSE, SEMICOLON, TEXT, COMMENT, INTERPOLATION, STRING
+
+
+def tokenize(string):
+  buffer = StringBuffer(string)
+  return ScssLexer(buffer.char_at, buffer.size()).tokenize()
+
+
+class TestScssLexer(unittest.TestCase):
+
+  def test_structural_tokens(self):
+    """Splits a rule into braces, text and semicolons."""
+    tokens = tokenize(".a{b:c;}")
+    actual_tokens = [tokens[index] for index in range(len(tokens))]
+    expected_tokens = [(TEXT, 0, 1), (OPEN, 2, 2), (TEXT, 3, 5), (SEMICOLON, 6, 6), (CLOSE, 7, 7)]
+
+    self.assertEqual(actual_tokens, expected_tokens)
+
+  def test_selector_text(self):
+    """Files the statement before each brace as its selector, without comments."""
+    string = """
+$foo: 1;
+.baz, // first
+.bar-#{$foo} {
+  .bang { top: 0; }
+}
+    """
+    tokens = tokenize(string)
+    actual_selectors = [tokens.selectors[index][1].strip() for index in sorted(tokens.selectors)]
+    expected_selectors = [".baz, .bar-#{$foo}", ".bang"]
+
+    self.assertEqual(actual_selectors, expected_selectors)
+
+  def test_braces_in_strings_and_interpolation(self):
+    """Does not treat braces inside strings or interpolation as structure."""
+    string = '.a { content: "}{"; width: #{map-get($m, "}")}; }'
+    tokens = tokenize(string)
+    actual_kinds = [kind for kind in tokens.kinds if kind != TEXT]
+    expected_kinds = [OPEN, STRING, SEMICOLON, INTERPOLATION, SEMICOLON, CLOSE]
+
+    self.assertEqual(actual_kinds, expected_kinds)
+
+  def test_comments(self):
+    """Collects comments into the comment index, ends inclusive."""
+    string = "/* a { */ .b {} // c }\n"
+    tokens = tokenize(string)
+
+    self.assertEqual(list(tokens.comments), [(0, 8), (16, 22)])
+    self.assertEqual([kind for kind in tokens.kinds].count(OPEN), 1)
+
+  def test_unterminated_tokens(self):
+    """Gives an unclosed comment or string the lexed size as its end."""
+    tokens = tokenize(".a { /* open")
+    self.assertEqual(tokens[len(tokens) - 1], (COMMENT, 5, 12))
+
+    tokens = tokenize("'open\n.b {")
+    self.assertEqual(tokens[0], (STRING, 0, 4))
+    self.assertEqual(tokens.selectors[2], (0, "'open\n.b "))
+
+  def test_cancellation(self):
+    """Stops with BuildCancelled once is_cancelled says so, checking every so often."""
+    string = ".a { b: c; }\n" * 1000
+    buffer = StringBuffer(string)
+    checks = []
+    def is_cancelled():
+      checks.append(True)
+      return len(checks) == 3
+
+    lexer = ScssLexer(buffer.char_at, buffer.size(), is_cancelled)
+    self.assertRaises(BuildCancelled, lexer.tokenize)
+    self.assertEqual(len(checks), 3)
+
+    tokens = ScssLexer(buffer.char_at, buffer.size(), lambda: False).tokenize()
+    self.assertEqual(len(tokens), len(tokenize(string)))
+
+  def test_windowed_scan(self):
+    """Gives the same tokens searching windows of a buffer as reading one character at a time."""
+    string = """.a, /* { */ .b { content: "}\\"" 'x
+  // } ;
+  .c-#{$d + "}" + #{e}} { f: g; }
+  h: i/j; }
+/* open"""
+    buffer = StringBuffer(string)
+    stepped = ScssLexer(lambda pos: buffer.char_at(pos), buffer.size()).tokenize()
+    for interval in [1, 2, 3, 4096]:
+      lexer = ScssLexer(buffer.char_at, buffer.size())
+      lexer.cancel_interval = interval
+      scanned = lexer.tokenize()
+
+      self.assertEqual([scanned[index] for index in range(len(scanned))],
+                       [stepped[index] for index in range(len(stepped))])
+      self.assertEqual(scanned.selectors, stepped.selectors)
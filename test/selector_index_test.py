@@ -0,0 +1,71 @@
+import unittest, sys, os
+
+if sys.version < '3':
+  from src.src_two.selector_index import SelectorIndex, canonical
+else:
+  from src.src_three.selector_index import SelectorIndex, canonical
+
+from test.project_files import ProjectFiles
+
+
+class TestSelectorIndex(ProjectFiles, unittest.TestCase):
+
+  def setUp(self):
+    ProjectFiles.setUp(self)
+    self.write('card.scss', """.card {
+  &__header {
+    &:hover, &:focus { x: y; }
+  }
+  > .title { z: w; }
+}
+""")
+    self.write('other.scss', '/* .card */ .card__header:hover { a: b; }')
+
+  def test_canonical(self):
+    """Writes combinators and whitespace one way."""
+    self.assertEqual(canonical(' .a>.b  ~.c\n.d '), '.a > .b ~ .c .d')
+
+  def test_lookup(self):
+    """Finds every rule that compiles to a selector, however it is spaced."""
+    index = SelectorIndex([self.directory])
+    index.refresh()
+
+    self.assertEqual(index.lookup('.card__header:hover'), [
+      (self.path('card.scss'), 43, 3),
+      (self.path('other.scss'), 32, 1),
+    ])
+    self.assertEqual(index.lookup('.card>.title'), [(self.path('card.scss'), 68, 5)])
+    self.assertEqual(index.lookup('.card .title'), [])
+
+  def test_duplicates(self):
+    """Finds the selectors that more than one rule compiles to."""
+    index = SelectorIndex([self.directory])
+    index.refresh()
+    expected_duplicates = [
+      ('.card__header:hover', [(self.path('card.scss'), 43, 3), (self.path('other.scss'), 32, 1)]),
+    ]
+
+    self.assertEqual(index.duplicates(), expected_duplicates)
+    self.assertEqual(index.duplicates(os.path.join(self.directory, 'other.scss')), expected_duplicates)
+
+    self.write('third.scss', '.card { z: w; }')
+    index.refresh()
+    self.assertEqual([selector for selector, entries in index.duplicates()], ['.card', '.card__header:hover'])
+    self.assertEqual(index.duplicates(os.path.join(self.directory, 'third.scss')),
+                     [('.card', [(self.path('card.scss'), 6, 1), (self.path('third.scss'), 6, 1)])])
+
+  def test_symbols(self):
+    """Lists every selector in the project in file order, until a file changes."""
+    index = SelectorIndex([self.directory])
+    index.refresh()
+    symbols = index.symbols()
+
+    self.assertEqual([(offset, line, selector) for path, offset, line, selector in symbols], [
+      (6, 1, '.card'), (20, 2, '.card__header'), (43, 3, '.card__header:focus'),
+      (43, 3, '.card__header:hover'), (68, 5, '.card > .title'), (32, 1, '.card__header:hover'),
+    ])
+    self.assertTrue(index.symbols() is symbols)
+
+    os.remove(os.path.join(self.directory, 'other.scss'))
+    index.refresh()
+    self.assertEqual(len(index.symbols()), 5)
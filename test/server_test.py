@@ -0,0 +1,91 @@
+import unittest, sys, os, json, subprocess
+
+if sys.version < '3':
+  from src.src_two.server import ExpandServer, INVALID_PARAMS, METHOD_NOT_FOUND
+else:
+  from src.src_three.server import ExpandServer, INVALID_PARAMS, METHOD_NOT_FOUND
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Talks to a server running as `python -m src.__main__ --serve`, as an editor would
+class Client():
+  def __init__(self):
+    self.process = subprocess.Popen([sys.executable, '-m', 'src.__main__', '--serve'], cwd = ROOT,
+                                    stdin = subprocess.PIPE, stdout = subprocess.PIPE)
+    self.next_id = 0
+
+  def send(self, message):
+    self.process.stdin.write((json.dumps(message) + '\n').encode('utf-8'))
+    self.process.stdin.flush()
+
+  def notify(self, method, **params):
+    self.send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+  def request(self, method, **params):
+    self.next_id += 1
+    self.send({'jsonrpc': '2.0', 'id': self.next_id, 'method': method, 'params': params})
+    response = json.loads(self.process.stdout.readline().decode('utf-8'))
+    assert response['id'] == self.next_id
+    return response
+
+  def close(self):
+    self.request('shutdown')
+    self.process.stdin.close()
+    self.process.stdout.close()
+    return self.process.wait()
+
+
+class TestServer(unittest.TestCase):
+
+  string = u'.a, .b {\n  .c { d: e; }\n}\n@media print { .f { g: h; } }\n'
+
+  def request(self, server, method, **params):
+    return server.handle({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params})
+
+  def test_changes(self):
+    """Follows incremental changes and expands against the latest text."""
+    server = ExpandServer()
+    self.assertEqual(server.handle({'jsonrpc': '2.0', 'method': 'didOpen',
+                                    'params': {'uri': 'x.scss', 'text': self.string, 'version': 1}}), None)
+    start = self.string.index('d: e')
+    server.handle({'jsonrpc': '2.0', 'method': 'didChange', 'params': {'uri': 'x.scss', 'version': 2,
+      'changes': [{'start': start, 'end': start, 'text': u'&:hover, .\u00e9 { '},
+                  {'start': start + 17, 'end': start + 17, 'text': u'} '}]}})
+
+    result = self.request(server, 'expand', uri = 'x.scss', offset = start + 12)['result']
+    self.assertEqual(result['rule'], u'.a .c:hover, .a .c .\u00e9, .b .c:hover, .b .c .\u00e9')
+    self.assertEqual(result['version'], 2)
+
+    server.handle({'jsonrpc': '2.0', 'method': 'didChange',
+                   'params': {'uri': 'x.scss', 'changes': [{'text': u'.g { h: i; }'}]}})
+    self.assertEqual(self.request(server, 'expand', uri = 'x.scss', offset = 6)['result']['selectors'], ['.g'])
+
+  def test_expand_all(self):
+    """Lists every rule in the same form as the command line."""
+    server = ExpandServer(max_selectors = 1)
+    server.handle({'jsonrpc': '2.0', 'method': 'didOpen', 'params': {'uri': 'x.scss', 'text': self.string}})
+    expected_records = [
+      {'offset': 7, 'end': 24, 'line': 1, 'selectors': ['.a']},
+      {'offset': 14, 'end': 22, 'line': 2, 'selectors': ['.a .c']},
+      {'offset': 44, 'end': 52, 'line': 4, 'selectors': ['@media print .f']},
+    ]
+
+    self.assertEqual(self.request(server, 'expandAll', uri = 'x.scss')['result'], expected_records)
+
+  def test_errors(self):
+    """Answers bad requests with errors and ignores bad notifications."""
+    server = ExpandServer()
+
+    self.assertEqual(self.request(server, 'expand', uri = 'x.scss', offset = 0)['error']['code'], INVALID_PARAMS)
+    self.assertEqual(self.request(server, 'format', uri = 'x.scss')['error']['code'], METHOD_NOT_FOUND)
+    self.assertEqual(server.handle({'jsonrpc': '2.0', 'method': 'didChange', 'params': {'uri': 'x.scss'}}), None)
+
+  def test_process(self):
+    """Serves a client over standard input and output until shut down."""
+    client = Client()
+    client.notify('didOpen', uri = 'x.scss', text = self.string)
+    client.notify('didChange', uri = 'x.scss', changes = [{'start': 1, 'end': 2, 'text': u'z'}])
+    self.assertEqual(client.request('expand', uri = 'x.scss', offset = 15)['result']['rule'], '.z .c, .b .c')
+    self.assertEqual(client.request('expand', uri = 'y.scss', offset = 0)['error']['code'], INVALID_PARAMS)
+    self.assertEqual(client.close(), 0)
@@ -0,0 +1,56 @@
+import unittest, sys
+from array import array
+
+if sys.version < '3':
+  from src.src_two.shifted_array import ShiftedArray, ShiftedScopes, plain
+  from src.src_two.scope_node import ScopeNode
+else:
+  from src.src_three.shifted_array import ShiftedArray, ShiftedScopes, plain
+  from src.src_three.scope_node import ScopeNode
+
+
+class TestShiftedArray(unittest.TestCase):
+
+  def test_replace(self):
+    """Replaces a run of values and moves the rest along, leaving the original alone."""
+    values = ShiftedArray(array('l', [1, 3, 5, 7, 9]))
+    replaced = values.replace(1, 3, array('l', [2, 3, 4]), 10)
+
+    self.assertEqual(list(replaced), [1, 2, 3, 4, 17, 19])
+    self.assertEqual(list(values), [1, 3, 5, 7, 9])
+    self.assertEqual(replaced[-1], 19)
+    self.assertEqual(plain(replaced), array('l', [1, 2, 3, 4, 17, 19]))
+
+  def test_moves_only_what_it_must(self):
+    """Keeps the move pending instead of rewriting the values after an edit."""
+    values = ShiftedArray(array('l', range(0, 100, 10)))
+    replaced = values.replace(2, 3, array('l', [21]), 5)
+
+    self.assertEqual(replaced.values[3:], array('l', range(30, 100, 10)))
+    self.assertEqual((replaced.step, replaced.delta), (3, 5))
+
+  def test_edits_either_side(self):
+    """Gives the same values whichever side of the last edit the next one is."""
+    expected = list(range(0, 100, 10))
+    values = ShiftedArray(array('l', expected))
+    for lo, hi, new_values, delta in [(5, 6, [51, 52], 2), (1, 2, [10], -1), (8, 9, [], 3), (4, 4, [44], 0)]:
+      values = values.replace(lo, hi, array('l', new_values), delta)
+      expected = expected[:lo] + new_values + [value + delta for value in expected[hi:]]
+      self.assertEqual(list(values), expected)
+      self.assertEqual([values[index] for index in range(len(values))], expected)
+
+  def test_add(self):
+    """Moves a single value."""
+    values = ShiftedArray(array('l', [1, 2, 3])).replace(0, 1, array('l', [0]), 1)
+    values.add(0, 5)
+    values.add(2, 5)
+
+    self.assertEqual(list(values), [5, 3, 9])
+
+  def test_scopes(self):
+    """Moves the span of a scope past the edit when it is read."""
+    scopes = ShiftedScopes([ScopeNode(0, 1, ".a"), ScopeNode(5, 6, ".b")])
+    replaced = scopes.replace(1, 1, [ScopeNode(3, 3, ".c")], 4)
+
+    self.assertEqual([(scope.start, scope.text) for scope in replaced], [(0, ".a"), (3, ".c"), (9, ".b")])
+    self.assertEqual(replaced[2].end, 10)